@@ -0,0 +1,259 @@
+#Description: Geometry backends for the shell thickness optimiser.
+
+"""The optimiser only needs four things from the CAD kernel: build an outside shell at a thickness, weigh the result, undo the
+shell and turn surface output into a solid. GeometryBackend is that interface. The Fusion 360 implementation lives in
+ShellOptimisation.py; the stand-ins here run headless so the solvers can be regression tested and profiled without a CAD kernel.
+NumPy is only needed for the mesh and voxel stand-ins."""
+
+import math
+
+try:
+    import numpy as np
+    from . import ShellMesh, ShellSDF
+except ImportError:
+    np = ShellMesh = ShellSDF = None
+
+from . import ShellCache, ShellEstimate, ShellSolvers
+
+
+# Class to define the geometry operations the optimiser needs. Thicknesses are in mm for the Fusion 360 backend and in model
+# units for the stand-ins; masses are in the backend's mass unit.
+class GeometryBackend:
+    name = 'Geometry backend'
+    vectorised = False # True if evaluateMany weighs a whole batch of thicknesses in one pass rather than one shell at a time
+
+    def __init__(self, quantum=1e-3):
+        self.cache = ShellCache.MassCache(quantum)
+        self.shellBuilds = 0
+
+    # Function to get the mass the shell has to retain (the component mass before shelling).
+    def targetMass(self):
+        raise NotImplementedError
+
+    # Function to replace any previous shell with an outside shell of the given thickness, returning the component mass or None.
+    def shell(self, thickness):
+        raise NotImplementedError
+
+    # Function to weigh the component in its current state.
+    def mass(self, accuracy=0):
+        raise NotImplementedError
+
+    # Function to remove the shell (and anything built on it) from the body.
+    def undo(self):
+        raise NotImplementedError
+
+    # Function to turn surface output of the last shell into a solid, returning False if that is not possible.
+    def surfaceToSolid(self):
+        return True
+
+    # Function to get the component mass at a thickness, only building shells for thicknesses not already evaluated.
+    def evaluate(self, thickness):
+        entry = self.cache.get(thickness)
+        if entry:
+            return entry[1]
+
+        self.shellBuilds += 1
+        shellMass = self.shell(thickness)
+        if shellMass is not None:
+            self.cache.put(thickness, shellMass, False)
+
+        return shellMass
+
+    # Function to get the component mass at each of many thicknesses, with None (or NaN from vectorised backends) for failed
+    # shells. Without a vectorised implementation this is one evaluate per thickness.
+    def evaluateMany(self, thicknesses):
+        return [self.evaluate(thickness) for thickness in thicknesses]
+
+    # Function to get the signed residual evaluate(thickness) - targetMass(), or None if the shell failed.
+    def residual(self, thickness):
+        shellMass = self.evaluate(thickness)
+        if shellMass is None:
+            return None
+        return shellMass - self.targetMass()
+
+    # Function to get the signed residuals at each of many thicknesses.
+    def residualMany(self, thicknesses):
+        masses = self.evaluateMany(thicknesses)
+        if np is not None and isinstance(masses, np.ndarray):
+            return masses - self.targetMass()
+        return [None if shellMass is None else shellMass - self.targetMass() for shellMass in masses]
+
+
+# Class to stand in for the CAD kernel with any mass(thickness) function (e.g. a synthetic curve), for solver tests and benchmarks.
+class FunctionBackend(GeometryBackend):
+    name = 'Function'
+
+    def __init__(self, massFunction, targetMass, quantum=1e-3, vectorised=False):
+        super().__init__(quantum)
+        self.massFunction = massFunction
+        self.target = targetMass
+        self.vectorised = vectorised # massFunction accepts a NumPy array of thicknesses
+        self.thickness = None
+
+    def targetMass(self):
+        return self.target
+
+    def shell(self, thickness):
+        self.thickness = thickness
+        return self.massFunction(thickness)
+
+    def mass(self, accuracy=0):
+        return self.target if self.thickness is None else self.massFunction(self.thickness)
+
+    def undo(self):
+        self.thickness = None
+
+    def evaluateMany(self, thicknesses):
+        if not self.vectorised:
+            return super().evaluateMany(thicknesses)
+        self.shellBuilds += len(thicknesses)
+        return np.asarray(self.massFunction(np.asarray(thicknesses, dtype=float)), dtype=float)
+
+
+# Class to stand in for the CAD kernel with a closed triangle mesh. The shell volume follows the Steiner offset-volume polynomial
+# A*t + M*t^2 + (4*pi/3)*t^3 with the volume, area and integrated mean curvature measured from the mesh.
+class MeshBackend(GeometryBackend):
+    name = 'Mesh'
+    vectorised = True
+
+    def __init__(self, vertices, faces, density, otherMass=0.0, quantum=1e-3):
+        if np is None:
+            raise ImportError('The mesh backend needs NumPy.')
+        super().__init__(quantum)
+
+        self.properties = ShellMesh.meshProperties(vertices, faces)
+        self.area = self.properties.area
+        self.volume = self.properties.volume
+        self.meanCurvature = self.properties.meanCurvature
+        self.density = density
+        self.otherMass = otherMass # Mass of the rest of the component, which the shell does not change
+        self.thickness = None
+
+    def targetMass(self):
+        return self.otherMass + self.density * self.volume
+
+    def shell(self, thickness):
+        if thickness <= 0:
+            return None
+        self.thickness = thickness
+        return self.mass()
+
+    def mass(self, accuracy=0):
+        if self.thickness is None:
+            return self.targetMass()
+        return self.otherMass + self.density * ShellEstimate.offsetShellVolume(self.area, self.meanCurvature, self.thickness)
+
+    def undo(self):
+        self.thickness = None
+
+    def evaluateMany(self, thicknesses):
+        thicknesses = np.asarray(thicknesses, dtype=float)
+        self.shellBuilds += len(thicknesses)
+        masses = self.otherMass + self.density * ShellEstimate.offsetShellVolume(self.area, self.meanCurvature, thicknesses)
+        return np.where(thicknesses > 0, masses, np.nan)
+
+    # Function to build a mesh backend from an STL or OBJ file.
+    @classmethod
+    def fromFile(cls, path, density, otherMass=0.0, quantum=1e-3):
+        if np is None:
+            raise ImportError('The mesh backend needs NumPy.')
+        vertices, faces = ShellMesh.loadMesh(path)
+        return cls(vertices, faces, density, otherMass=otherMass, quantum=quantum)
+
+
+# Class to stand in for the CAD kernel with the voxel distance field of a closed mesh, which unlike the Steiner polynomial
+# accounts for the outside offset self-intersecting in concave regions.
+class SDFBackend(GeometryBackend):
+    name = 'Voxel SDF'
+    vectorised = True
+
+    def __init__(self, vertices, faces, density, otherMass=0.0, maxThickness=None, pitch=None, resolution=128, quantum=1e-3):
+        if np is None:
+            raise ImportError('The voxel backend needs NumPy.')
+        super().__init__(quantum)
+
+        self.volume = ShellMesh.meshProperties(vertices, faces).volume
+        self.density = density
+        self.otherMass = otherMass
+        if maxThickness is None:
+            seed = ShellSDF.shellSeed(vertices, faces, density, pitch=pitch, resolution=resolution)
+            self.field = seed[2] if seed else ShellSDF.distanceField(vertices, faces, 1.0, pitch=pitch, resolution=resolution)
+        else:
+            self.field = ShellSDF.distanceField(vertices, faces, maxThickness, pitch=pitch, resolution=resolution)
+        self.thickness = None
+
+    def targetMass(self):
+        return self.otherMass + self.density * self.volume
+
+    def shell(self, thickness):
+        if thickness <= 0 or thickness > self.field.maxThickness:
+            return None
+        self.thickness = thickness
+        return self.mass()
+
+    def mass(self, accuracy=0):
+        if self.thickness is None:
+            return self.targetMass()
+        return self.otherMass + self.density * float(self.field.shellVolume(self.thickness))
+
+    def undo(self):
+        self.thickness = None
+
+    def evaluateMany(self, thicknesses):
+        thicknesses = np.asarray(thicknesses, dtype=float)
+        self.shellBuilds += len(thicknesses)
+        masses = self.otherMass + self.density * self.field.shellVolume(thicknesses)
+        return np.where(thicknesses > 0, masses, np.nan)
+
+    # Function to build a voxel backend from an STL or OBJ file.
+    @classmethod
+    def fromFile(cls, path, density, otherMass=0.0, resolution=128, quantum=1e-3):
+        if np is None:
+            raise ImportError('The voxel backend needs NumPy.')
+        vertices, faces = ShellMesh.loadMesh(path)
+        return cls(vertices, faces, density, otherMass=otherMass, resolution=resolution, quantum=quantum)
+
+
+# Function to optimise the shell thickness on any backend with one of the root finding solver modes. Vectorised backends
+# bracket the root by sampling batches of thicknesses before the solver refines it.
+def optimise(backend, mode, initialThickness, tolerance, xtol=1e-3, maxEvaluations=50, bracket=None, callback=None, samples=32):
+    if mode == ShellSolvers.LEGACY_NELDER_MEAD:
+        raise ValueError(f"{mode} is only available inside Fusion 360.")
+
+    residualMany = backend.residualMany if backend.vectorised else None
+    return ShellSolvers.solve(mode, backend.residual, initialThickness, tolerance, xtol, maxEvaluations, callback=callback,
+                              bracket=bracket, residualMany=residualMany, samples=samples)
+
+
+# Function to build a closed triangle mesh of a box, for quick headless checks.
+def boxMesh(lx, ly, lz):
+    vertices = [(x, y, z) for z in (0, lz) for y in (0, ly) for x in (0, lx)]
+    faces = [(0, 2, 1), (1, 2, 3), (4, 5, 6), (5, 7, 6), (0, 1, 4), (1, 5, 4),
+             (2, 6, 3), (3, 6, 7), (0, 4, 2), (2, 4, 6), (1, 3, 5), (3, 7, 5)]
+    return vertices, faces
+
+
+# Function to build a closed triangle mesh of a UV sphere, for quick headless checks.
+def sphereMesh(radius, segments=32, rings=16):
+    vertices = [(0.0, 0.0, radius)]
+    for i in range(1, rings):
+        phi = math.pi * i / rings
+        for j in range(segments):
+            theta = 2 * math.pi * j / segments
+            vertices.append((radius * math.sin(phi) * math.cos(theta), radius * math.sin(phi) * math.sin(theta), radius * math.cos(phi)))
+    vertices.append((0.0, 0.0, -radius))
+
+    faces, last = [], len(vertices) - 1
+    for j in range(segments):
+        faces.append((0, 1 + j, 1 + (j + 1) % segments))
+    for i in range(rings - 2):
+        for j in range(segments):
+            a, b = 1 + i * segments + j, 1 + i * segments + (j + 1) % segments
+            c, d = a + segments, b + segments
+            faces.append((a, c, b))
+            faces.append((b, c, d))
+    for j in range(segments):
+        a, b = 1 + (rings - 2) * segments + j, 1 + (rings - 2) * segments + (j + 1) % segments
+        faces.append((a, last, b))
+
+    return vertices, faces
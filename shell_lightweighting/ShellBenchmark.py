@@ -0,0 +1,242 @@
+#Description: Headless benchmark of the shell thickness solvers on stand-in mass functions.
+
+"""Counts the shell builds each solver mode needs on synthetic smooth, noisy, stepped and failing mass curves. Run with:
+python -m shell_lightweighting.ShellBenchmark [--seconds-per-build 20]"""
+
+import argparse, math, random, statistics
+
+from . import ShellBackends, ShellEstimate, ShellSolvers
+
+
+# Function to get a stand-in mass(thickness) from the Steiner polynomial of a part (cm and kg, like Fusion 360), with thickness in mm.
+def steinerMassFunction(area, meanCurvature, density, otherMass=0.0):
+    return lambda thickness: otherMass + density * ShellEstimate.offsetShellVolume(area, meanCurvature, 0.1 * thickness)
+
+
+# Solver label of the Nelder-Mead loop as originally shipped, benchmarked next to the current legacy mode.
+SHIPPED_NELDER_MEAD = 'Nelder-Mead (as originally shipped)'
+
+
+# Function to replay the original Nelder-Mead loop as it shipped on a backend, returning (thickness, mass, shell builds). The
+# expansion, contraction and shrink steps evaluate the reflected point, the best vertex is rebuilt after every step, and every
+# evaluation builds a shell, as it did before the mass cache.
+def shippedNelderMead(backend, initialThickness, tolerance, maxIterations):
+    alpha, gamma, rho, sigma = 1.0, 2.0, 0.5, 0.5
+    solidMass = backend.targetMass()
+    builds = 0
+
+    def objective(thickness):
+        nonlocal builds
+        builds += 1
+        shellMass = backend.shell(thickness)
+        return (shellMass - solidMass)**2 if shellMass else 1e6
+
+    simplex = [initialThickness, initialThickness*1.1, initialThickness*1.2]
+    simplex_values = [objective(thickness) for thickness in simplex]
+    iteration, shellMass = 0, None
+    while iteration <= maxIterations:
+        sorted_indices = sorted(range(len(simplex_values)), key=lambda i: simplex_values[i])
+        simplex = [simplex[i] for i in sorted_indices]
+        simplex_values = [simplex_values[i] for i in sorted_indices]
+        centroid = sum(simplex[:-1]) / len(simplex[:-1])
+
+        reflected_thickness = centroid + alpha * (centroid - simplex[-1])
+        reflected_value = objective(reflected_thickness)
+        if simplex_values[0] <= reflected_value < simplex_values[-2]:
+            simplex[-1], simplex_values[-1] = reflected_thickness, reflected_value
+        elif reflected_value < simplex_values[0]:
+            expanded_thickness = centroid + gamma * (reflected_thickness - centroid)
+            expanded_value = objective(reflected_thickness)
+            if expanded_value < reflected_value:
+                simplex[-1], simplex_values[-1] = expanded_thickness, expanded_value
+            else:
+                simplex[-1], simplex_values[-1] = reflected_thickness, reflected_value
+        else:
+            contracted_thickness = centroid + (rho if reflected_value < simplex_values[-1] else -rho) * (simplex[-1] - centroid)
+            contracted_value = objective(reflected_thickness)
+            if contracted_value < simplex_values[-1]:
+                simplex[-1], simplex_values[-1] = contracted_thickness, contracted_value
+            else:
+                for i in range(1, len(simplex)):
+                    simplex[i] = simplex[0] + sigma * (simplex[i] - simplex[0])
+                    simplex_values[i] = objective(reflected_thickness)
+
+        iteration += 1
+        builds += 1
+        shellMass = backend.shell(simplex[0])
+        if shellMass and abs(shellMass - solidMass) < tolerance:
+            break
+
+    return simplex[0], shellMass, builds
+
+
+# Function to run the add-in's legacy Nelder-Mead mode on a backend, returning (thickness, mass, shell builds). Evaluations go
+# through the backend's mass cache like the add-in's.
+def legacyNelderMead(backend, initialThickness, tolerance, maxIterations):
+    solidMass = backend.targetMass()
+
+    def evaluate(thickness, iteration, step):
+        shellMass = backend.evaluate(thickness)
+        return ((shellMass - solidMass)**2, shellMass) if shellMass else (1e6, None)
+
+    try:
+        thickness, shellMass, _ = ShellSolvers.legacyNelderMead(evaluate, solidMass, initialThickness, tolerance, maxIterations)
+    except ShellSolvers.SolverEvaluationFailed:
+        thickness, shellMass = None, None
+    return thickness, shellMass, backend.shellBuilds
+
+
+# Function to replay one of the two Nelder-Mead loops above by its solver label, returning (thickness, mass, shell builds).
+def replayNelderMead(mode, backend, initialThickness, tolerance, maxIterations):
+    replay = shippedNelderMead if mode == SHIPPED_NELDER_MEAD else legacyNelderMead
+    return replay(backend, initialThickness, tolerance, maxIterations)
+
+
+# Function to compare the shipped and current legacy loops with the reimplemented Nelder-Mead and the root finders on one
+# stand-in, returning rows of (solver, shell builds, thickness, mass error, converged).
+def compareNelderMead(massFunction, targetMass, initialThickness, tolerance, maxIterations=50, xtol=1e-3):
+    rows = []
+
+    for mode in (SHIPPED_NELDER_MEAD, ShellSolvers.LEGACY_NELDER_MEAD):
+        thickness, shellMass, builds = replayNelderMead(mode, ShellBackends.FunctionBackend(massFunction, targetMass), initialThickness, tolerance, maxIterations)
+        error = math.inf if shellMass is None else shellMass - targetMass
+        rows.append((mode, builds, thickness, error, abs(error) < tolerance))
+
+    for mode in (ShellSolvers.NELDER_MEAD, ShellSolvers.BRENT):
+        backend = ShellBackends.FunctionBackend(massFunction, targetMass)
+        result = ShellBackends.optimise(backend, mode, initialThickness, tolerance, xtol, maxIterations)
+        rows.append((mode, backend.shellBuilds, result.thickness, result.residual, result.converged))
+
+    return rows
+
+
+# Relative error of Fusion 360's physical properties at each calculation accuracy, used as the noise level of the stand-ins.
+ACCURACY_NOISE = {'Low': 1e-3, 'Medium': 1e-4, 'High': 1e-5, 'Very high': 1e-6}
+
+
+# Class to hold a synthetic mass(thickness) curve: the clean curve the error is measured on, the curve the solvers see (with
+# noise, steps or failures) and the thickness that retains the target mass.
+class SyntheticCurve:
+    def __init__(self, name, clean, targetMass, noise=0.0, step=None, failureRate=0.0, seed=0):
+        self.name = name
+        self.clean = clean
+        self.targetMass = targetMass
+        self.noise = noise # Relative standard deviation of the mass
+        self.step = step # (thickness, relative mass offset) added above the thickness, e.g. where the stitch fallback takes over
+        self.failureRate = failureRate # Share of thicknesses whose shell fails
+        self.seed = seed
+        self.root = self.rootThickness()
+
+    # Function to get the noise-free mass, including any step.
+    def reference(self, thickness):
+        mass = self.clean(thickness)
+        if self.step and thickness >= self.step[0]:
+            mass *= 1 + self.step[1]
+        return mass
+
+    # Function to get the mass the solver sees. Noise and failures are repeatable per thickness, as a CAD kernel's would be.
+    def __call__(self, thickness):
+        generator = random.Random(hash((self.seed, round(thickness, 9))))
+        if generator.random() < self.failureRate:
+            return None
+        return self.reference(thickness) * (1 + self.noise * generator.gauss(0, 1))
+
+    # Function to find the thickness where the reference curve reaches the target mass by bisection.
+    def rootThickness(self, lo=1e-3, hi=1e3):
+        for _ in range(200):
+            mid = 0.5 * (lo + hi)
+            if self.reference(mid) < self.targetMass:
+                lo = mid
+            else:
+                hi = mid
+        return hi
+
+
+# Function to build the library of synthetic curves from a few parts (cm and kg, retaining their own mass).
+def curveLibrary():
+    parts = [
+        ('Block 100x60x40 steel', 2 * (10 * 6 + 10 * 4 + 6 * 4), math.pi * (10 + 6 + 4), 10 * 6 * 4, 7.85e-3),
+        ('Plate 200x200x5 aluminium', 2 * (20 * 20 + 2 * 20 * 0.5), math.pi * (20 + 20 + 0.5), 20 * 20 * 0.5, 2.7e-3),
+        ('Sphere r50 titanium', 4 * math.pi * 25, 4 * math.pi * 5, 4 / 3 * math.pi * 125, 4.43e-3),
+    ]
+
+    curves = []
+    for seed, (part, area, meanCurvature, volume, density) in enumerate(parts):
+        clean = steinerMassFunction(area, meanCurvature, density)
+        target = density * volume
+        root = SyntheticCurve(part, clean, target).root
+        curves += [
+            SyntheticCurve(f"{part}, smooth", clean, target),
+            SyntheticCurve(f"{part}, low accuracy noise", clean, target, noise=ACCURACY_NOISE['Low'], seed=seed),
+            SyntheticCurve(f"{part}, high accuracy noise", clean, target, noise=ACCURACY_NOISE['High'], seed=seed),
+            SyntheticCurve(f"{part}, stitch fallback step", clean, target, step=(0.8 * root, 5e-3)),
+            SyntheticCurve(f"{part}, 10 % failed shells", clean, target, failureRate=0.1, seed=seed),
+        ]
+    return curves
+
+
+# Function to run one solver mode on a curve, returning (shell builds, thickness, converged, absolute mass error on the reference
+# curve, thickness error).
+def runSolver(mode, curve, initialThickness, tolerance, maxEvaluations=50, xtol=1e-3):
+    backend = ShellBackends.FunctionBackend(curve, curve.targetMass)
+    if mode in (SHIPPED_NELDER_MEAD, ShellSolvers.LEGACY_NELDER_MEAD):
+        thickness, shellMass, builds = replayNelderMead(mode, backend, initialThickness, tolerance, maxEvaluations)
+        converged = shellMass is not None and abs(shellMass - curve.targetMass) < tolerance
+    else:
+        result = ShellBackends.optimise(backend, mode, initialThickness, tolerance, xtol, maxEvaluations)
+        thickness, builds, converged = result.thickness, backend.shellBuilds, result.converged
+    if thickness is None:
+        return builds, None, False, math.inf, math.inf
+    return builds, thickness, converged, abs(curve.reference(thickness) - curve.targetMass), abs(thickness - curve.root)
+
+
+# Function to benchmark every solver mode, and the Nelder-Mead loop as originally shipped, on every curve from starting points
+# spread around each root, returning rows of (solver, curve, mean builds, convergence rate, median mass error, median thickness
+# error, Fusion minutes per run).
+def benchmark(curves, modes=ShellSolvers.SOLVER_MODES + [SHIPPED_NELDER_MEAD], starts=(0.31, 0.67, 1.37, 2.23), tolerance=1e-4, secondsPerBuild=20.0):
+    rows = []
+    for mode in modes:
+        for curve in curves:
+            runs = [runSolver(mode, curve, start * curve.root, tolerance) for start in starts]
+            builds = statistics.mean(run[0] for run in runs)
+            rows.append((mode, curve.name, builds, sum(run[2] for run in runs) / len(runs), statistics.median(run[3] for run in runs),
+                         statistics.median(run[4] for run in runs), builds * secondsPerBuild / 60))
+    return rows
+
+
+# Function to total benchmark rows per solver, returning (solver, mean builds, convergence rate, Fusion minutes per run).
+def summarise(rows):
+    summary = []
+    for mode in dict.fromkeys(row[0] for row in rows):
+        solverRows = [row for row in rows if row[0] == mode]
+        summary.append((mode, statistics.mean(row[2] for row in solverRows), statistics.mean(row[3] for row in solverRows),
+                        statistics.mean(row[6] for row in solverRows)))
+    return summary
+
+
+# Function to format benchmark rows as a fixed-width table.
+def formatTable(headings, rows):
+    cells = [[str(heading) for heading in headings]] + [[f"{value:.6g}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headings))]
+    return '\n'.join('  '.join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(row, widths))) for row in cells)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the shell thickness solvers on synthetic mass(thickness) curves.')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='Mass tolerance in kg (default 0.1 g)')
+    parser.add_argument('--seconds-per-build', type=float, default=20.0, help='Fusion 360 seconds per shell build, for the minutes column')
+    parser.add_argument('--nelder-mead', action='store_true', help='Only compare the shipped, legacy and reimplemented Nelder-Mead per starting point')
+    args = parser.parse_args()
+
+    if args.nelder_mead:
+        for curve in curveLibrary()[::5]:
+            for start in (0.31, 0.67, 1.37, 2.23):
+                rows = compareNelderMead(curve, curve.targetMass, start * curve.root, args.tolerance)
+                print(f"\n{curve.name}, initial thickness {round(start * curve.root, 3)} mm")
+                print(formatTable(['Solver', 'Builds', 'Thickness (mm)', 'Mass error (kg)', 'Converged'], rows))
+        raise SystemExit
+
+    rows = benchmark(curveLibrary(), tolerance=args.tolerance, secondsPerBuild=args.seconds_per_build)
+    print(formatTable(['Solver', 'Curve', 'Builds', 'Converged', 'Mass error (kg)', 'Thickness error (mm)', 'Fusion (min)'], rows))
+    print()
+    print(formatTable(['Solver', 'Mean builds', 'Convergence rate', 'Fusion (min per run)'], summarise(rows)))
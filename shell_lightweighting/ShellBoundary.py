@@ -0,0 +1,129 @@
+#Description: Closed-loop check of the boundary edges of a surface body before it is patched.
+
+"""Union-find over hashed edge endpoints, O(E) where the original all-pairs scan was O(E^2). Run the benchmark with:
+python -m shell_lightweighting.ShellBoundary"""
+
+import argparse, math, random, timeit
+
+
+# Class to hold the outcome of a boundary check: the number of connected pieces of the boundary, the indices of the edges that
+# end at a vertex no other edge continues from, and the number of edges checked.
+class BoundaryLoops:
+    def __init__(self, loops, openEdges, edges):
+        self.loops = loops
+        self.openEdges = openEdges
+        self.edges = edges
+        self.closed = edges > 0 and not openEdges
+
+    def __repr__(self):
+        return f"BoundaryLoops(loops={self.loops}, openEdges={len(self.openEdges)}, edges={self.edges}, closed={self.closed})"
+
+
+# Function to check whether edges given as (start point, end point) pairs form closed loops. Endpoints within about the tolerance
+# of each other are treated as the same vertex (points either side of a grid line can still miss each other).
+def boundaryLoops(segments, tolerance=1e-6):
+    vertexIds = {}
+    parent = []
+    degree = []
+
+    def vertexId(point):
+        x, y, z = point
+        key = (round(x / tolerance), round(y / tolerance), round(z / tolerance))
+        vertex = vertexIds.get(key)
+        if vertex is None:
+            vertex = vertexIds[key] = len(parent)
+            parent.append(vertex)
+            degree.append(0)
+        return vertex
+
+    def root(vertex):
+        # Path halving keeps the trees flat without recursion
+        while parent[vertex] != vertex:
+            parent[vertex] = parent[parent[vertex]]
+            vertex = parent[vertex]
+        return vertex
+
+    ends = []
+    for start, end in segments:
+        a, b = vertexId(start), vertexId(end)
+        degree[a] += 1
+        degree[b] += 1
+        ends.append((a, b))
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[ra] = rb
+
+    loops = len({root(vertex) for vertex in range(len(parent))})
+    openEdges = [index for index, (a, b) in enumerate(ends) if degree[a] % 2 or degree[b] % 2]
+    return BoundaryLoops(loops, openEdges, len(ends))
+
+
+# Function to replay the original check: every edge has to share its start with another edge's end or its end with another
+# edge's start, found by scanning all pairs.
+def legacyBoundaryClosed(segments):
+    points = set((tuple(start), tuple(end)) for start, end in segments)
+
+    for point1, point2 in points:
+        is_connected = False
+        for other_point1, other_point2 in points:
+            if (point1 != other_point1) and (point1 == other_point2 or point2 == other_point1):
+                is_connected = True
+                break
+        if not is_connected:
+            return False
+
+    return True
+
+
+# Function to build synthetic boundary edges: closed polygon loops of the given size with jittered radii, in shuffled order and
+# with a share of edges reversed, optionally with some edges removed to open their loops.
+def syntheticLoops(edges, loopSize=1000, openings=0, reversedShare=0.0, seed=0):
+    generator = random.Random(seed)
+    segments = []
+    for loop in range(max(edges // loopSize, 1)):
+        n = min(loopSize, edges)
+        points = []
+        for i in range(n):
+            angle = 2 * math.pi * i / n
+            radius = 1 + 0.1 * generator.random()
+            points.append((radius * math.cos(angle), radius * math.sin(angle), 0.01 * loop))
+        for i in range(n):
+            start, end = points[i], points[(i + 1) % n]
+            segments.append((end, start) if generator.random() < reversedShare else (start, end))
+    generator.shuffle(segments)
+    for _ in range(openings):
+        segments.pop(generator.randrange(len(segments)))
+    return segments
+
+
+# Function to time the hashed check (and the original check up to legacyLimit edges) on synthetic loops, returning rows of
+# (edges, loops, open edges, closed, hashed seconds, original seconds or None). The loops are consistently oriented, as the
+# original check needs, and closed by default so the original has to scan every edge rather than stop at the first open one.
+def benchmark(sizes=(10000, 30000, 100000), loopSize=1000, openings=0, legacyLimit=10000, seed=0):
+    rows = []
+    for size in sizes:
+        segments = syntheticLoops(size, loopSize, openings, seed=seed)
+        t0 = timeit.default_timer()
+        check = boundaryLoops(segments)
+        hashed = timeit.default_timer() - t0
+
+        legacy = None
+        if size <= legacyLimit:
+            t0 = timeit.default_timer()
+            legacyBoundaryClosed(segments)
+            legacy = timeit.default_timer() - t0
+        rows.append((len(segments), check.loops, len(check.openEdges), check.closed, hashed, legacy))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the boundary loop check on synthetic loops.')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000, 30000, 100000], help='Numbers of edges (default 10k, 30k and 100k)')
+    parser.add_argument('--loop-size', type=int, default=1000, help='Edges per loop')
+    parser.add_argument('--openings', type=int, default=0, help='Edges removed to open loops')
+    parser.add_argument('--legacy-limit', type=int, default=10000, help='Largest number of edges to time the original all-pairs check on')
+    args = parser.parse_args()
+
+    print(f"{'Edges':>8}  {'Loops':>6}  {'Open':>5}  {'Closed':>6}  {'Hashed (s)':>10}  {'Original (s)':>12}")
+    for edges, loops, openEdges, closed, hashed, legacy in benchmark(args.sizes, args.loop_size, args.openings, args.legacy_limit):
+        print(f"{edges:>8}  {loops:>6}  {openEdges:>5}  {str(closed):>6}  {hashed:>10.4f}  {'-' if legacy is None else f'{legacy:.4f}':>12}")
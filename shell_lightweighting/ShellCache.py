@@ -0,0 +1,138 @@
+#Description: Thickness to mass memoisation for the shell thickness optimiser.
+
+"""Caches the outcome of each shell evaluation so that repeated thicknesses do not rebuild the shell in Fusion 360, and which stitch
+tolerance turned the surface fallback into a solid so that later evaluations do not climb the whole tolerance ladder again."""
+
+import math
+
+
+# Class to hold the (thickness, shellMass, surfaceFallbackUsed, accuracy) outcome of each evaluated thickness, where accuracy is the
+# rank of the mass calculation accuracy (higher is more accurate).
+class MassCache:
+    def __init__(self, quantum=1e-3):
+        self.quantum = quantum # Thickness quantum in mm (1e-3 mm = 1 um)
+        self.signature = None
+        self.entries = {}
+        self.hits, self.misses = 0, 0
+
+    # Function to quantise a thickness onto the cache grid.
+    def key(self, thickness):
+        return int(round(thickness / self.quantum))
+
+    # Function to drop every entry and bind the cache to a new body/design state.
+    def reset(self, signature=None):
+        self.signature = signature
+        self.entries = {}
+        self.hits, self.misses = 0, 0
+
+    # Function to keep the cache only if the body and its upstream timeline are unchanged (hit/miss counts restart per run).
+    def validate(self, signature):
+        if signature != self.signature:
+            self.reset(signature)
+            return False
+        self.hits, self.misses = 0, 0
+        return True
+
+    # Function to look up a thickness weighed at the given accuracy rank or better, returning the entry or None.
+    def get(self, thickness, accuracy=0):
+        entry = self.entries.get(self.key(thickness))
+        if entry is not None and entry[3] < accuracy:
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    # Function to store the outcome of a thickness evaluation.
+    def put(self, thickness, shellMass, surfaceFallbackUsed, accuracy=0):
+        entry = (thickness, shellMass, surfaceFallbackUsed, accuracy)
+        self.entries[self.key(thickness)] = entry
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, thickness):
+        return self.key(thickness) in self.entries
+
+
+# Class to hold the masses of the bodies in a component that an optimisation run does not touch, so that each evaluation only
+# re-weighs the bodies the shell/stitch/combine pipeline created or modified.
+class ComponentMassCache:
+    def __init__(self):
+        self.reset()
+
+    # Function to forget every recorded body.
+    def reset(self):
+        self.masses = {} # Entity token -> mass of each untouched body
+        self.staticMass = 0.0
+        self.accuracy = None # Accuracy rank the untouched bodies were weighed at
+        self.ready = False # Set once every untouched body has been recorded
+
+    # Function to record the mass of an untouched body.
+    def record(self, token, mass):
+        self.masses[token] = mass
+        self.staticMass = sum(self.masses.values())
+
+    # Function to check whether a body is one of the recorded untouched bodies.
+    def isStatic(self, token):
+        return token in self.masses
+
+    # Function to get the component mass from the untouched bodies and the masses of the touched bodies.
+    def totalMass(self, touchedMasses):
+        return self.staticMass + sum(touchedMasses)
+
+
+# Class to remember, per body and thickness band, which stitch tolerance (and whether patching the surface) gave a solid in the
+# surface fallback, and how often each has failed. Bands are geometric, so neighbouring thicknesses share what was learnt.
+class StitchMemory:
+    def __init__(self, bandRatio=1.25, maxFailures=2):
+        self.bandRatio = bandRatio # Ratio of the upper to the lower thickness of a band
+        self.maxFailures = maxFailures # Failures after which a step is skipped
+        self.reset()
+
+    # Function to forget every body.
+    def reset(self):
+        self.successes = {} # (body, band) -> (tolerance, patched) of the last stitch that gave a solid
+        self.failures = {} # (body, band) -> {(tolerance, patched): failed stitches}
+
+    # Function to get the (body, band) key of a thickness in mm.
+    def key(self, body, thickness):
+        if not thickness or thickness <= 0:
+            return (body, None)
+        return (body, int(math.floor(math.log(thickness) / math.log(self.bandRatio))))
+
+    # Function to get the last successful step for a key, falling back to the neighbouring bands.
+    def lastSuccess(self, key):
+        body, band = key
+        for neighbour in ([band] if band is None else [band, band - 1, band + 1]):
+            step = self.successes.get((body, neighbour))
+            if step:
+                return step
+        return None
+
+    # Function to order the stitch steps for a key: the unpatched ladder then the patched ladder, with the last successful step
+    # first and steps that failed maxFailures times skipped. If every step is hopeless the full ladder is tried again.
+    def order(self, key, tolerances):
+        steps = [(tolerance, False) for tolerance in tolerances] + [(tolerance, True) for tolerance in tolerances]
+        success = self.lastSuccess(key)
+        if success in steps:
+            # A body that needed patching last time will need it again, so the unpatched ladder is not retried first
+            steps = [success] + [step for step in steps if step != success and (step[1] or not success[1])]
+
+        failures = self.failures.get(key, {})
+        viable = [step for step in steps if step == success or failures.get(step, 0) < self.maxFailures]
+        return viable or steps
+
+    # Function to record the step that gave a solid, clearing its failures.
+    def recordSuccess(self, key, tolerance, patched):
+        self.successes[key] = (tolerance, patched)
+        failures = self.failures.get(key)
+        if failures:
+            failures.pop((tolerance, patched), None)
+
+    # Function to record a step whose stitch failed or did not give a solid.
+    def recordFailure(self, key, tolerance, patched):
+        failures = self.failures.setdefault(key, {})
+        failures[(tolerance, patched)] = failures.get((tolerance, patched), 0) + 1
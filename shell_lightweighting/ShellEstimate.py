@@ -0,0 +1,68 @@
+#Description: Analytic first guess of the outside shell thickness from a body's physical properties.
+
+"""Solves A*t + M*t^2 + (4*pi/3)*t^3 = shell volume for t, with M, which Fusion 360 does not report, taken from the sphere."""
+
+import math
+
+
+# Function to get the shell volume A*t + M*t^2 + (4*pi/3)*t^3 of an outside offset of thickness t.
+def offsetShellVolume(area, meanCurvature, thickness):
+    return thickness * (area + thickness * (meanCurvature + thickness * 4 * math.pi / 3))
+
+
+# Function to solve A*t + M*t^2 + (4*pi/3)*t^3 = shellVolume for the smallest positive thickness.
+def steinerThickness(area, meanCurvature, shellVolume, xtol=1e-12, maxIterations=100):
+    if area <= 0 or shellVolume <= 0:
+        return None
+
+    # Bracket the root: the cubic term alone and the linear term alone both overestimate it for non-negative M
+    hi = min(shellVolume / area, (3 * shellVolume / (4 * math.pi)) ** (1 / 3))
+    while offsetShellVolume(area, meanCurvature, hi) < shellVolume:
+        hi *= 2
+    lo = 0.0
+
+    # Newton's method safeguarded by bisection (the polynomial is increasing wherever its derivative is positive)
+    t = hi
+    for _ in range(maxIterations):
+        f = offsetShellVolume(area, meanCurvature, t) - shellVolume
+        if f > 0:
+            hi = t
+        else:
+            lo = t
+        df = area + 2 * meanCurvature * t + 4 * math.pi * t * t
+        step = t - f / df if df > 0 else None
+        if step is None or not lo < step < hi:
+            step = 0.5 * (lo + hi)
+        if abs(step - t) < xtol:
+            return step
+        t = step
+
+    return t
+
+
+# Function to get the integrated mean curvature of the sphere with the given surface area (lower bound for convex bodies).
+def sphereMeanCurvature(area):
+    return math.sqrt(4 * math.pi * area)
+
+
+# Function to estimate the shell thickness and a starting interval for the bracket search from a body's volume, area, mass and
+# density. The estimate uses the sphere's M, the smallest M of any convex body with that area, so it is the thickest shell a
+# convex body could need rather than a typical one.
+def steinerSeed(volume, area, targetMass, density, curvatureSpread=2.0):
+    if not density or density <= 0:
+        return None
+
+    # The shell replaces the body, so it has to hold the body's share of the target mass at the same density
+    shellVolume = targetMass / density if targetMass else volume
+    meanCurvature = sphereMeanCurvature(area)
+
+    thickness = steinerThickness(area, meanCurvature, shellVolume)
+    if thickness is None:
+        return None
+
+    # Larger M gives a thinner shell and M = 0 the thickest (a flat sheet). This is only a starting interval: elongated bodies
+    # with M above curvatureSpread times the sphere's need a thinner shell than lo, and findBracket widens the interval for them
+    lo = steinerThickness(area, curvatureSpread * meanCurvature, shellVolume)
+    hi = steinerThickness(area, 0.0, shellVolume)
+
+    return thickness, (lo, hi)
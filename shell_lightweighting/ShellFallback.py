@@ -0,0 +1,93 @@
+#Description: Prediction of the stitch fallback from the geometry of a body.
+
+"""Turns concave radii, gaps and tangent chains into the thickness from which the shell is expected to give surface output,
+then tunes that limit to what the builds actually did. Lengths are in mm."""
+
+import math
+
+
+# Class to hold the geometry that decides whether an outside offset stays a solid: the smallest concave radius, the narrowest
+# gap between walls of the body, and how many edges join tangent faces.
+class FallbackFeatures:
+    def __init__(self, minConcaveRadius=math.inf, minGap=math.inf, tangentEdges=0, edges=0):
+        self.minConcaveRadius = minConcaveRadius
+        self.minGap = minGap
+        self.tangentEdges = tangentEdges
+        self.edges = edges
+
+    def __repr__(self):
+        return f"FallbackFeatures(minConcaveRadius={self.minConcaveRadius}, minGap={self.minGap}, tangentEdges={self.tangentEdges}, edges={self.edges})"
+
+    # Function to get the share of edges that join tangent faces.
+    def tangentShare(self):
+        return self.tangentEdges / self.edges if self.edges else 0.0
+
+    # Function to get the thickness from which the offset is expected to collapse or collide (inf for none), brought forward
+    # by the margin and by the tangent margin in proportion to the share of tangent edges.
+    def limit(self, margin=0.05, tangentMargin=0.15):
+        collapse = min(self.minConcaveRadius, 0.5 * self.minGap)
+        return collapse * (1 - margin - tangentMargin * self.tangentShare())
+
+
+# Class to predict whether a shell thickness gives surface output and record what each build actually did. The thinnest shell
+# seen to give surface output and the thickest seen to stay a solid override the geometric limit, on the grounds that the
+# fallback does not switch off again as the shell thickens.
+class FallbackPredictor:
+    def __init__(self, features, margin=0.05, tangentMargin=0.15):
+        self.features = features
+        self.geometricLimit = features.limit(margin, tangentMargin)
+        self.limit = self.geometricLimit # Thickness from which surface output is predicted
+        self.minSurface = math.inf # Thinnest shell seen to give surface output
+        self.maxSolid = 0.0 # Thickest shell seen to stay a solid
+        self.outcomes = [] # (thickness, predicted, actual) of every recorded build
+
+    # Function to predict whether a thickness gives surface output.
+    def predict(self, thickness):
+        if thickness >= self.minSurface:
+            return True
+        if thickness <= self.maxSolid:
+            return False
+        return thickness >= self.limit
+
+    # Function to describe why a thickness is predicted to give surface output, for the log.
+    def reason(self, thickness):
+        if thickness >= self.minSurface:
+            return f"a {self.minSurface} mm shell already gave surface output"
+        if self.limit != self.geometricLimit:
+            return f"the limit has been tuned to {self.limit} mm"
+        features = self.features
+        if features.minConcaveRadius <= 0.5 * features.minGap:
+            cause = f"concave radius {features.minConcaveRadius} mm"
+        else:
+            cause = f"gap {features.minGap} mm"
+        return f"{cause}, {features.tangentEdges} of {features.edges} edges tangent"
+
+    # Function to record what a build did, returning True if the prediction was wrong. A wrong prediction moves the limit to
+    # the thickness that was wrong.
+    def record(self, thickness, predicted, actual):
+        self.outcomes.append((thickness, predicted, actual))
+        if actual:
+            self.minSurface = min(self.minSurface, thickness)
+        else:
+            self.maxSolid = max(self.maxSolid, thickness)
+
+        if predicted == actual:
+            return False
+        if actual:
+            self.limit = min(self.limit, thickness)
+        elif self.minSurface > thickness:
+            self.limit = max(self.limit, thickness)
+        return True
+
+    # Function to get the recorded builds whose prediction was wrong.
+    def wrong(self):
+        return [outcome for outcome in self.outcomes if outcome[1] != outcome[2]]
+
+    # Function to summarise the features and predictions for the run log footer (None for no limit).
+    def summary(self):
+        wrong = self.wrong()
+        finite = lambda value: None if math.isinf(value) else value
+        features = self.features
+        return {'minConcaveRadius': finite(features.minConcaveRadius), 'minGap': finite(features.minGap), 'tangentEdges': features.tangentEdges,
+                'edges': features.edges, 'geometricLimit': finite(self.geometricLimit), 'limit': finite(self.limit), 'predictions': len(self.outcomes), 'wrong': len(wrong),
+                'missedFallbacks': sum(1 for _, _, actual in wrong if actual), 'falseFallbacks': sum(1 for _, _, actual in wrong if not actual)}
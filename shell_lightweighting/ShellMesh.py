@@ -0,0 +1,151 @@
+#Description: NumPy shell mass estimator for closed triangle meshes.
+
+"""Volume, area and integrated mean curvature of a closed STL or OBJ mesh, for the Steiner estimate of the shell thickness
+(exact for convex meshes, an estimate otherwise)."""
+
+import math, os, struct
+
+import numpy as np
+
+from . import ShellEstimate
+
+
+# Class to hold the volume, area and integrated mean curvature of a closed mesh and the offset-volume polynomial they define.
+class MeshProperties:
+    def __init__(self, volume, area, meanCurvature, bounds, concaveCurvature=0.0):
+        self.volume = volume
+        self.area = area
+        self.meanCurvature = meanCurvature
+        self.bounds = bounds # (min xyz, max xyz)
+        self.concaveCurvature = concaveCurvature # Share of the mean curvature from concave edges (zero for convex meshes)
+
+    def __repr__(self):
+        return f"MeshProperties(volume={self.volume}, area={self.area}, meanCurvature={self.meanCurvature})"
+
+    # Function to get the coefficients of V(t), highest power first.
+    def offsetPolynomial(self):
+        return [4 * math.pi / 3, self.meanCurvature, self.area, self.volume]
+
+    # Function to get the volume V(t) of the outside offset for one thickness or an array of thicknesses.
+    def offsetVolume(self, thickness):
+        return np.polyval(self.offsetPolynomial(), thickness)
+
+    # Function to get the shell volume V(t) - V for one thickness or an array of thicknesses.
+    def shellVolume(self, thickness):
+        return self.offsetVolume(thickness) - self.volume
+
+    # Function to get the outside shell thickness that carries the target mass at the given density.
+    def shellThickness(self, density, targetMass):
+        if not density or density <= 0:
+            return None
+        return ShellEstimate.steinerThickness(self.area, self.meanCurvature, targetMass / density)
+
+
+# Function to merge vertices that are within a tolerance of each other, so faces share vertices across edges.
+def weldVertices(vertices, faces, tolerance=1e-9):
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64)
+    scale = tolerance if tolerance > 0 else 1.0
+    keys = np.round(vertices / scale).astype(np.int64)
+    _, index, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return vertices[index], inverse.reshape(-1)[faces]
+
+
+# Function to build welded vertices and faces from flat coordinate and index lists (e.g. a Fusion 360 TriangleMesh).
+def fromFlatArrays(coordinates, indices, tolerance=1e-9):
+    vertices = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+    faces = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    return weldVertices(vertices, faces, tolerance)
+
+
+# Function to read a binary or ASCII STL file into welded vertices and faces.
+def loadStl(path, tolerance=1e-9):
+    with open(path, 'rb') as stlFile:
+        data = stlFile.read()
+
+    # Binary STL: 80 byte header, uint32 count, then 50 bytes per triangle
+    if len(data) >= 84:
+        count = struct.unpack_from('<I', data, 80)[0]
+        if len(data) == 84 + 50 * count:
+            records = np.frombuffer(data, dtype=np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')]), count=count, offset=84)
+            triangles = records['vertices'].astype(float)
+            return weldVertices(triangles.reshape(-1, 3), np.arange(3 * count).reshape(-1, 3), tolerance)
+
+    # ASCII STL
+    coordinates = [line.split()[1:4] for line in data.decode('ascii', 'ignore').splitlines() if line.strip().startswith('vertex')]
+    triangles = np.array(coordinates, dtype=float)
+    return weldVertices(triangles, np.arange(len(triangles)).reshape(-1, 3), tolerance)
+
+
+# Function to read an OBJ file into vertices and faces (polygons are fan triangulated).
+def loadObj(path):
+    vertices, faces = [], []
+    with open(path, 'r') as objFile:
+        for line in objFile:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'v':
+                vertices.append([float(value) for value in parts[1:4]])
+            elif parts[0] == 'f':
+                indices = [int(part.split('/')[0]) for part in parts[1:]]
+                indices = [index - 1 if index > 0 else len(vertices) + index for index in indices]
+                for i in range(1, len(indices) - 1):
+                    faces.append((indices[0], indices[i], indices[i + 1]))
+    return np.array(vertices, dtype=float), np.array(faces, dtype=np.int64)
+
+
+# Function to read a mesh file by its extension.
+def loadMesh(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.stl':
+        return loadStl(path)
+    if extension == '.obj':
+        return loadObj(path)
+    raise ValueError(f"Unsupported mesh file: {path}")
+
+
+# Function to measure the volume, area and integrated mean curvature of a closed, consistently oriented triangle mesh.
+def meshProperties(vertices, faces):
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64)
+
+    v0, v1, v2 = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    cross = np.cross(v1 - v0, v2 - v0)
+    doubleArea = np.linalg.norm(cross, axis=1)
+    area = 0.5 * float(doubleArea.sum())
+    volume = float(np.einsum('ij,ij->', v0, np.cross(v1, v2))) / 6
+
+    # Unit face normals (degenerate faces get a zero normal and contribute nothing)
+    normals = np.divide(cross, doubleArea[:, None], out=np.zeros_like(cross), where=doubleArea[:, None] > 0)
+
+    # Pair every directed edge with its twin in the neighbouring face
+    faceCount = len(faces)
+    directed = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    owners = np.tile(np.arange(faceCount), 3)
+    keys = np.sort(directed, axis=1)
+    order = np.lexsort((keys[:, 1], keys[:, 0]))
+    keys, directed, owners = keys[order], directed[order], owners[order]
+    if len(keys) % 2 or not np.array_equal(keys[0::2], keys[1::2]):
+        raise ValueError('Mesh is not closed: every edge must be shared by exactly two faces.')
+
+    edges = vertices[directed[0::2, 1]] - vertices[directed[0::2, 0]]
+    lengths = np.linalg.norm(edges, axis=1)
+    n1, n2 = normals[owners[0::2]], normals[owners[1::2]]
+
+    # Signed exterior dihedral angle, positive on convex edges
+    sine = np.einsum('ij,ij->i', np.cross(n1, n2), np.divide(edges, lengths[:, None], out=np.zeros_like(edges), where=lengths[:, None] > 0))
+    cosine = np.einsum('ij,ij->i', n1, n2)
+    contributions = 0.5 * lengths * np.arctan2(sine, cosine)
+    meanCurvature = float(contributions.sum())
+    concaveCurvature = float(contributions[contributions < 0].sum())
+
+    return MeshProperties(volume, area, meanCurvature, (vertices.min(axis=0), vertices.max(axis=0)), concaveCurvature)
+
+
+# Function to get the outside shell thickness and a bracket around it for a mesh, density and the mass the shell has to retain.
+def steinerSeed(properties, density, targetMass, margin=0.05):
+    thickness = properties.shellThickness(density, targetMass)
+    if thickness is None:
+        return None
+    return thickness, ((1 - margin) * thickness, (1 + margin) * thickness)
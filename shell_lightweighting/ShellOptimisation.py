@@ -5,7 +5,15 @@
 """This is a Fusion 360 add-in designed to be placed (within its Microchannels parent folder) in the Fusion 360 Add-ins folder (typically: 'C:/Users/$user$/AppData/Roaming/Autodesk/Autodesk Fusion 360/API/AddIns')."""
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
-import os, datetime, timeit
+import os, datetime, math, timeit
+
+from . import ShellBackends, ShellBoundary, ShellCache, ShellEstimate, ShellFallback, ShellRunDatabase, ShellRunLog, ShellSolvers, ShellTiming
+
+# The mesh and voxel estimators need NumPy, which Fusion 360's Python does not always have.
+try:
+    from . import ShellMesh, ShellSDF
+except ImportError:
+    ShellMesh = ShellSDF = None
 
 # Global list to keep all event handlers in scope.
 
@@ -15,31 +23,157 @@ _tolerance = adsk.core.ValueCommandInput.cast(None)
 _maxIterations = adsk.core.IntegerSpinnerCommandInput.cast(None)
 _errMessage = adsk.core.TextBoxCommandInput.cast(None)
 _bodySelection = adsk.core.SelectionCommandInput.cast(None)
+_solverMode = adsk.core.DropDownCommandInput.cast(None)
+_evaluationMode = adsk.core.DropDownCommandInput.cast(None)
 _wasSurface = False
 _debug = True
 
+# Thickness to mass memoisation.
+_cacheQuantum = 1e-3 # Thickness quantum of the mass cache in mm (1 um)
+_massCache = ShellCache.MassCache(_cacheQuantum)
+_builtThickness = None # Thickness of the shell currently in the design (None if no shell is built)
+_stitchMemory = ShellCache.StitchMemory() # Stitch tolerance that gave a solid per body and thickness band
+
+# Incremental component weighing.
+_componentMassCache = ShellCache.ComponentMassCache() # Masses of the bodies the run does not touch
+_verifyComponentMass = False # Also re-weigh the whole component and report any difference
+
+# Mass calculation accuracy, ranked from the least to the most accurate.
+LOW_ACCURACY, MEDIUM_ACCURACY, HIGH_ACCURACY, VERY_HIGH_ACCURACY = 0, 1, 2, 3
+ACCURACY_NAMES = ['Low', 'Medium', 'High', 'Very high']
+_adaptiveAccuracy = True # Weigh at low accuracy far from the target and at high accuracy close to it
+_accuracySwitch = 10.0 # Re-weigh at high accuracy once the residual is within this many tolerances
+
+# Batch timeline edits (undo and shell, failed stitch deletion and the next stitch) under a single deferred compute.
+_deferCompute = True
+
+# Shell evaluation modes.
+RECREATE_MODE = 'Recreate'
+IN_PLACE_MODE = 'In-place'
+SCRATCH_MODE = 'Scratch component'
+EVALUATION_MODES = [RECREATE_MODE, IN_PLACE_MODE, SCRATCH_MODE]
+_scratch = None # (occurrence, body, previously active occurrence) of the scratch component trial shells run in
+_evaluation = None # EvaluationContext of the features and bodies the last evaluation created (None if no shell is built)
+_lastEvaluation = (None, 0.0, LOW_ACCURACY, False) # (path, seconds, accuracy, surface fallback used) of the last thickness evaluation
+_evaluationCounts = {} # Number of evaluations per path in the current run
+
+# Per-stage timing of the shell evaluation pipeline.
+_stageTimer = ShellTiming.StageTimer()
+_traceEnabled = False # Write a Chrome Trace Event JSON file next to the log
+
+# Machine-readable run log written next to the text log (ShellRunLog.JSONL, ShellRunLog.CSV or None for the text log only).
+_structuredLog = ShellRunLog.JSONL
+_runLog = None # RunLog of the current run
+_textLog = None # Buffered text log of the current run, console output is batched until it is flushed at each iteration
+_textPalette = None # Cached TextCommands palette
+
+# Seed the solvers from the Steiner offset-volume estimate instead of the initial thickness input.
+_analyticSeed = True
+_meshSeed = True # Measure the mean curvature from a mesh of the body when NumPy is available
+_voxelSeed = True # Use the voxel distance field instead of the Steiner polynomial when the mesh has concave edges
+_voxelResolution = 128 # Voxels along the longest side of the body
+_distanceField = None # Voxel distance field of the last mesh seed (cm), reused for the narrowest gap
+
+# Predict from the body's geometry whether a thickness gives surface output, and build those shells from scratch up front.
+_predictFallback = True
+_fallbackPredictor = None # FallbackPredictor of the current run
+_lastPrediction = None # Whether surface output was predicted for the last evaluation (None if nothing was predicted)
+
+# Persistent record of runs, used to warm-start repeat optimisations of the same or a near-identical body.
+_runDatabase = True
+_runDatabaseName = 'ShellRuns.sqlite' # Stored in the log directory
+_warmStartDistance = 0.05 # Largest relative difference in volume, area or bounding box to warm-start from
+
 # This is only needed for Python.
 handlers = []
 
 
 def debugToConsole(message):
-    global _debug
+    global _debug, _textLog
 
     if _debug:
+        if _textLog:
+            _textLog.echo(message + '\n')
+        else:
+            textCommandsPalette().writeText(message + '\n')
+
+
+# Function to get the TextCommands palette, only looking it up again if the cached reference is no longer valid.
+def textCommandsPalette():
+    global _textPalette
+
+    if not _textPalette or not _textPalette.isValid:
         app = adsk.core.Application.get()
-        ui = app.userInterface
+        _textPalette = app.userInterface.palettes.itemById('TextCommands')
+    if not _textPalette.isVisible:
+        _textPalette.isVisible = True # Open the Text Command window if it's not already open
+
+    return _textPalette
+
+
+# Function to append text to a log file, through the run's buffered text log when it is the one open.
+def writeLog(logPath, text):
+    global _textLog
+
+    if _textLog and _textLog.path == logPath:
+        _textLog.write(text)
+    else:
+        with open(logPath, 'a') as logFile:
+            logFile.write(text)
+
+
+# Function to flush and close the run's text log.
+def closeTextLog():
+    global _textLog
+
+    if _textLog:
+        textLog, _textLog = _textLog, None
+        textLog.close()
+
+
+# Function to stop Fusion 360 recomputing the design after each timeline edit until endDeferredCompute is called.
+def beginDeferredCompute():
+    global _deferCompute
+
+    if not _deferCompute:
+        return
 
-        textPalette = ui.palettes.itemById('TextCommands')
-        if not textPalette.isVisible:
-            textPalette.isVisible = True
-        textPalette.writeText(message + '\n')
+    design = adsk.core.Application.get().activeProduct
+    if design and isinstance(design, adsk.fusion.Design) and not design.isComputeDeferred:
+        design.isComputeDeferred = True
 
 
-# Function to get the overall mass of the whole active component.
-def weighComponent():
+# Function to run any deferred compute now, before a step's result is checked or the design is queried.
+def endDeferredCompute():
+    design = adsk.core.Application.get().activeProduct
+    if design and isinstance(design, adsk.fusion.Design) and design.isComputeDeferred:
+        with _stageTimer.span('compute'):
+            design.isComputeDeferred = False
+
+
+# Function to get the Fusion 360 calculation accuracy for an accuracy rank.
+def calculationAccuracy(accuracy):
+    return [adsk.fusion.CalculationAccuracy.LowCalculationAccuracy,
+            adsk.fusion.CalculationAccuracy.MediumCalculationAccuracy,
+            adsk.fusion.CalculationAccuracy.HighCalculationAccuracy,
+            adsk.fusion.CalculationAccuracy.VeryHighCalculationAccuracy][accuracy]
+
+
+# Function to get the mass of a body at the given accuracy rank (the physicalProperties accessor is low accuracy).
+def bodyMass(bRepBody, accuracy=LOW_ACCURACY):
+    if accuracy == LOW_ACCURACY:
+        return bRepBody.physicalProperties.mass
+    return bRepBody.getPhysicalProperties(calculationAccuracy(accuracy)).mass
+
+
+# Function to get the overall mass of the whole active component. If touched bodies are given and the untouched body masses have
+# been recorded, only the touched bodies are re-weighed.
+def weighComponent(touchedBodies=None, accuracy=LOW_ACCURACY):
     app = adsk.core.Application.get()
     design = app.activeProduct
 
+    global _componentMassCache, _verifyComponentMass
+
     # Check if we have a valid design
     if not design or not isinstance(design, adsk.fusion.Design):
         debugToConsole('No active Fusion 360 design found.')
@@ -47,14 +181,154 @@ def weighComponent():
 
     activeComponent = design.activeComponent
 
+    # Physical properties need an up-to-date design
+    endDeferredCompute()
+
+    if touchedBodies is not None and _componentMassCache.ready:
+        # Weigh each touched body once, skipping any that are already counted as untouched
+        touchedMasses, tokens = [], set()
+        with _stageTimer.span('weigh'):
+            for bRepBody in touchedBodies:
+                if not bRepBody or not bRepBody.isValid:
+                    continue
+                token = bRepBody.entityToken
+                if token in tokens or _componentMassCache.isStatic(token):
+                    continue
+                tokens.add(token)
+                touchedMasses.append(bodyMass(bRepBody, accuracy))
+            totalMass = _componentMassCache.totalMass(touchedMasses)
+
+        if _verifyComponentMass:
+            # Re-weigh the untouched bodies at the accuracy they were recorded at, so only a wrong incremental total shows up
+            fullMass = sum(bodyMass(bRepBody, _componentMassCache.accuracy if _componentMassCache.isStatic(bRepBody.entityToken) else accuracy)
+                           for bRepBody in activeComponent.bRepBodies)
+            if _scratch:
+                fullMass += _componentMassCache.staticMass
+            if abs(fullMass - totalMass) > 1e-9 * max(1.0, abs(fullMass)):
+                debugToConsole(f"Incremental component mass {round(1e3*totalMass, 6)} g differs from full re-weigh {round(1e3*fullMass, 6)} g.")
+
+        return totalMass
+
     # Get the mass of the whole component
     totalMass = 0
-    for bRepBody in activeComponent.bRepBodies:
-        totalMass += bRepBody.physicalProperties.mass
+    with _stageTimer.span('weigh'):
+        for bRepBody in activeComponent.bRepBodies:
+            totalMass += bodyMass(bRepBody, accuracy)
+
+    # Trial shells in the scratch component stand in for the selected body, the rest of the user's component is unchanged
+    if _scratch:
+        totalMass += _componentMassCache.staticMass
     
     return totalMass
 
 
+# Function to record the masses of every body in the active component other than the one being shelled (weighed once, so at the
+# highest accuracy any evaluation will use).
+def recordUntouchedBodies(body, accuracy=LOW_ACCURACY):
+    app = adsk.core.Application.get()
+    design = app.activeProduct
+
+    global _componentMassCache
+
+    _componentMassCache.reset()
+    selectedToken = body.entityToken
+    for bRepBody in design.activeComponent.bRepBodies:
+        token = bRepBody.entityToken
+        if token != selectedToken:
+            _componentMassCache.record(token, bodyMass(bRepBody, accuracy))
+    _componentMassCache.accuracy = accuracy
+    _componentMassCache.ready = True
+
+
+# Class to hold direct references to what one evaluation created: the shell feature, any surface bodies it gave, every patch,
+# stitch and combine feature of the surface fallback (failed ones included), and every body these created or modified. Cleanup
+# and weighing only touch these, so no component collection is scanned or searched by name.
+class EvaluationContext:
+    def __init__(self, body, shellFeature):
+        self.body = body # Body being shelled
+        self.shellFeature = shellFeature
+        self.surfaceBodies = [] # Non-solid bodies the shell gave
+        self.fallbackFeatures = [] # Patch, stitch and combine features in the order they were created
+        self.touchedBodies = [body] # Bodies created or modified by the evaluation
+        self.touch(shellFeature)
+
+    # Function to note the bodies of a feature as created or modified by the evaluation.
+    def touch(self, feature):
+        if feature:
+            for bRepBody in feature.bodies:
+                self.touchedBodies.append(bRepBody)
+
+    # Function to note a fallback feature as created by the evaluation, whether or not it gave a solid.
+    def created(self, feature):
+        if feature:
+            self.fallbackFeatures.append(feature)
+
+    # Function to get the features the evaluation created, in the order they were created.
+    def features(self):
+        return [feature for feature in [self.shellFeature] + self.fallbackFeatures if feature]
+
+    # Function to check that the shell feature is still in the design.
+    def hasShell(self):
+        return self.shellFeature is not None and self.shellFeature.isValid
+
+
+# Function to note the bodies of a feature as created or modified by the current evaluation.
+def touchBodies(feature):
+    global _evaluation
+
+    if _evaluation:
+        _evaluation.touch(feature)
+
+
+# Function to get the bodies created or modified by the current evaluation.
+def touchedBodies():
+    global _evaluation
+
+    return _evaluation.touchedBodies if _evaluation else []
+
+
+# Function to get the bodies a shell can have left non-solid: the shelled body and the bodies of the shell feature.
+def shellBodies(evaluation):
+    return [evaluation.body] + [bRepBody for bRepBody in evaluation.shellFeature.bodies]
+
+
+# Function to get the surface bodies the current evaluation's shell gave, only scanning the component for non-solid bodies if
+# there is no evaluation to ask (e.g. surfaceToSolid called on its own).
+def surfaceBodies(component):
+    global _evaluation
+
+    if _evaluation:
+        return [bRepBody for bRepBody in _evaluation.surfaceBodies if bRepBody.isValid and not bRepBody.isSolid]
+    return [bRepBody for bRepBody in component.bRepBodies if not bRepBody.isSolid]
+
+
+# Function to describe the body, the other bodies of the active component and the upstream timeline, so cached masses (which are
+# component masses) can be invalidated when any of them changes.
+def designSignature(body):
+    app = adsk.core.Application.get()
+    design = app.activeProduct
+
+    # Check if we have a valid design
+    if not design or not isinstance(design, adsk.fusion.Design):
+        debugToConsole('No active Fusion 360 design found.')
+        return None
+
+    # Direct modelling designs have no timeline, so only the bodies describe them
+    timeline = design.timeline if design.designType == adsk.fusion.DesignTypes.ParametricDesignType else None
+    physicalProperties = body.physicalProperties
+
+    # The bodies the shell leaves untouched still count towards every cached mass
+    selectedToken = body.entityToken
+    untouchedBodies = []
+    for bRepBody in design.activeComponent.bRepBodies:
+        if bRepBody.entityToken != selectedToken:
+            properties = bRepBody.physicalProperties
+            untouchedBodies.append((bRepBody.entityToken, round(properties.volume, 9), properties.density))
+
+    return (selectedToken, timeline.count if timeline else None, timeline.markerPosition if timeline else None, round(physicalProperties.volume, 9), round(physicalProperties.area, 9), physicalProperties.density,
+            tuple(sorted(untouchedBodies)))
+
+
 # Function to undo the last shell feature created on a body.
 def undoShellFeatures():
     try:
@@ -63,7 +337,7 @@ def undoShellFeatures():
         ui = app.userInterface
         design = app.activeProduct
 
-        global _debug, _wasSurface
+        global _debug, _wasSurface, _builtThickness, _evaluation
         
         # Check if we have a valid design
         if not design or not isinstance(design, adsk.fusion.Design):
@@ -76,14 +350,24 @@ def undoShellFeatures():
         debugToConsole(f"Attempting to undo shell features on '{activeComponent.name}'.")
         
         message = ""
-        if _wasSurface:
+        if _evaluation and _evaluation.hasShell():
+            # Delete what the last evaluation created (a failed fallback's patch included), latest first
+            features = [feature for feature in _evaluation.features() if feature.isValid]
+            for feature in reversed(features):
+                feature.deleteMe()
+            message += f"Deleted the {len(features)} features created by the last evaluation."
+
+            _wasSurface = False # Reset the flag
+
+        elif _wasSurface:
 
             # Get the timeline object
             timeline = design.timeline
             features_to_delete = []
             shell_feature_found = False
 
-            # Iterate over the timeline in chronological order
+            # Without an evaluation context (e.g. after the add-in is reloaded) the fallback's features are found by scanning the
+            # timeline in chronological order
             for timeline_obj in timeline:
                 # Skip groups in the timeline
                 if timeline_obj.isGroup:
@@ -99,14 +383,14 @@ def undoShellFeatures():
                 
                 # Once shell feature is found, add all following features to the delete list
                 elif shell_feature_found:
-                    if isinstance(feature, (adsk.fusion.StitchFeature, adsk.fusion.CombineFeature)):
+                    if isinstance(feature, (adsk.fusion.StitchFeature, adsk.fusion.PatchFeature, adsk.fusion.CombineFeature)):
                         features_to_delete.append(feature)
 
             # Delete the features in reverse order (starting with the latest feature)
             for feature in reversed(features_to_delete):
                 feature.deleteMe()  # Safely delete the feature entity
 
-            message += 'All features related to Combined_Body have been removed, starting from the shell feature.'
+            message += f"All features related to Combined_Body have been removed, starting from the shell feature ({len(features_to_delete)} features)."
 
             _wasSurface = False # Reset the flag
         
@@ -133,6 +417,9 @@ def undoShellFeatures():
         
         debugToConsole(message)
 
+        _builtThickness = None
+        _evaluation = None
+
         return True
     
     except:
@@ -144,26 +431,6 @@ def undoShellFeatures():
 # Function to patch a surface body to create a solid body.
 def patchSurface():
 
-    def is_boundary_closed(boundaryEdges):
-        # tolerance = 0.0001  # Tolerance for considering edges as connected
-        points = set()
-
-        # Collect all start and end points of the edges
-        for edge in boundaryEdges:
-            points.add((edge.startVertex.geometry.asArray(), edge.endVertex.geometry.asArray()))
-        
-        # Check if each point is connected to another point
-        for point1, point2 in points:
-            is_connected = False
-            for other_point1, other_point2 in points:
-                if (point1 != other_point1) and (point1 == other_point2 or point2 == other_point1):
-                    is_connected = True
-                    break
-            if not is_connected:
-                return False
-        
-        return True
-
     try:
         # Get the active Fusion 360 application and user interface
         app = adsk.core.Application.get()
@@ -177,17 +444,17 @@ def patchSurface():
 
         activeComponent = design.activeComponent
 
-        # Collect any non-solid bodies (there should only be one in this case)
-        surfaceBody = None
-        for bRepBody in activeComponent.bRepBodies:
-            if not bRepBody.isSolid:
-                surfaceBody = bRepBody
-                break
+        # Finish any deferred edits (e.g. a failed stitch deletion) before looking for the surface body
+        endDeferredCompute()
+
+        # Get the non-solid body the shell gave (there should only be one in this case)
+        surfaces = surfaceBodies(activeComponent)
 
         # Ensure that a non-solid body was found
-        if not surfaceBody:
+        if not surfaces:
             debugToConsole("No non-solid bodies found to patch.")
             return None
+        surfaceBody = surfaces[0]
 
         # Create an ObjectCollection to hold the boundary edges
         boundaryEdgesCollection = adsk.core.ObjectCollection.create()
@@ -200,20 +467,28 @@ def patchSurface():
             debugToConsole("No boundary edges found to patch.")
             return None
 
-        # Check if the boundary is closed
-        if not is_boundary_closed(boundaryEdgesCollection):
-            debugToConsole("The boundary edges are not closed. A valid closed loop is required for patching.")
+        # Check if the boundary (the edges with a single face) is closed
+        segments = [(edge.startVertex.geometry.asArray(), edge.endVertex.geometry.asArray()) for edge in boundaryEdgesCollection if edge.faces.count == 1]
+        boundary = ShellBoundary.boundaryLoops(segments)
+        if not boundary.closed:
+            debugToConsole(f"The boundary edges are not closed ({boundary.loops} loops, {len(boundary.openEdges)} of {boundary.edges} edges open). A valid closed loop is required for patching.")
             return None
+        debugToConsole(f"Patching {boundary.loops} closed boundary loops of {boundary.edges} edges.")
 
         # Create the patch feature input using the boundary edges
         patches = activeComponent.features.patchFeatures
         patchInput = patches.createInput(boundaryEdgesCollection, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
 
         # Try to create the patch feature
-        patchFeature = patches.add(patchInput)
+        with _stageTimer.span('patch'):
+            patchFeature = patches.add(patchInput)
+        if _evaluation:
+            _evaluation.created(patchFeature) # Recorded whatever the outcome, so that undo removes a failed patch too
+        endDeferredCompute() # Timed as compute, outside the patch span
 
         # Check if the patch was successful and returned a solid body
         if patchFeature.bodies.count > 0 and patchFeature.bodies.item(0).isSolid:
+            touchBodies(patchFeature)
             # Cache the patch body name
             patchBodyName = patchFeature.bodies.item(0).name
             debugToConsole(f"Successfully patched a solid body: {patchBodyName}.")
@@ -231,13 +506,13 @@ def patchSurface():
 
 
 # Function to turn any surface results into a solid body.
-def surfaceToSolid(selectedBody=None):
+def surfaceToSolid(selectedBody=None, thickness=None):
 
     app = adsk.core.Application.get()
     ui  = app.userInterface
     design = app.activeProduct
 
-    global _debug
+    global _debug, _stitchMemory, _evaluation
 
     # Check if we have a valid design
     if not design or not isinstance(design, adsk.fusion.Design):
@@ -249,12 +524,10 @@ def surfaceToSolid(selectedBody=None):
     # Create an ObjectCollection to hold the surface bodies
     surfacesCollection = adsk.core.ObjectCollection.create()
 
-    # Collect any non-solid bodies (there should only be one in this case)
-    for bRepBody in activeComponent.bRepBodies:
-        if not bRepBody.isSolid:
-            surfaceBody = bRepBody
-            surfacesCollection.add(bRepBody)
-            break
+    # Collect the non-solid body the shell gave (there should only be one in this case)
+    for bRepBody in surfaceBodies(activeComponent)[:1]:
+        surfaceBody = bRepBody
+        surfacesCollection.add(bRepBody)
 
     # Ensure that the surfacesCollection is not empty
     if surfacesCollection.count == 0:
@@ -264,44 +537,56 @@ def surfaceToSolid(selectedBody=None):
         # Create the stitch feature input
         stitches = activeComponent.features.stitchFeatures
         tols = ['0.1 mm', '1 mm', '10 mm']
-        ii, patchTried = 0, False
-        while ii < len(tols):
-            tol = tols[ii]
+
+        # Start from the tolerance (and patching) that worked last time for this body and thickness band, skipping hopeless ones
+        memoryKey = _stitchMemory.key(_massCache.signature or selectedBody.entityToken, thickness)
+        steps = _stitchMemory.order(memoryKey, tols)
+        if steps[0] != (tols[0], False):
+            debugToConsole(f"Stitching from {steps[0][0]}{' after patching' if steps[0][1] else ''} ({len(steps)} of {2 * len(tols)} ladder steps).")
+
+        stitchedBody, patchTried = None, False
+        for tol, patched in steps:
+            if patched and not patchTried:
+                patchTried = True
+                patchSurface()
+            elif patchTried and not patched:
+                continue # The surface cannot be unpatched
             stitchInput = stitches.createInput(surfacesCollection, adsk.core.ValueInput.createByString(tol), adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
             tolFailMessage = f"Failed to stitch a solid body from {surfaceBody.name} with tolerance: {tol}."
 
             # Create the stitch feature
             try:
-                stitchFeature = stitches.add(stitchInput)
+                with _stageTimer.span('stitch'):
+                    stitchFeature = stitches.add(stitchInput)
+                if _evaluation:
+                    _evaluation.created(stitchFeature) # Recorded whatever the outcome, so that undo removes a stitch that gave no body too
+                endDeferredCompute()  # The stitch has to be computed to check that it produced a solid (timed as compute, outside the stitch span)
                 if stitchFeature.bodies.count > 0:
                     if stitchFeature.bodies.item(0).isSolid:
+                        stitchedBody = stitchFeature.bodies.item(0)
+                        _stitchMemory.recordSuccess(memoryKey, tol, patchTried)
                         break
                     else:
-                        # Delete the failed stitch feature
+                        # Delete the failed stitch feature (computed together with the next patch or stitch)
+                        beginDeferredCompute()
                         stitchFeature.deleteMe()
-                        if not patchTried:
-                            patchTried = True
-                            debugToConsole(tolFailMessage + f" Attempting to patch the surface.")
-                            patchSurface()
-                            ii = 0
-                        else:
-                            debugToConsole(tolFailMessage)
-                            ii += 1
+                        needsPatch = True
                 else:
-                    debugToConsole(tolFailMessage)
-                    ii += 1
+                    needsPatch = False
             except:
-                if not patchTried:
-                    patchTried = True
-                    debugToConsole(tolFailMessage + f" Attempting to patch the surface.")
-                    patchSurface()
-                    ii = 0
-                else:
-                    debugToConsole(tolFailMessage)
-                    ii += 1
+                needsPatch = True
+
+            _stitchMemory.recordFailure(memoryKey, tol, patchTried)
+            if needsPatch and not patchTried:
+                # Patch the surface and carry on with the patched steps
+                debugToConsole(tolFailMessage + f" Attempting to patch the surface.")
+                patchTried = True
+                patchSurface()
+            else:
+                debugToConsole(tolFailMessage)
     
-    if stitchFeature.bodies.count > 0:
-        stitchedBody = stitchFeature.bodies.item(0)
+    if stitchedBody:
+        touchBodies(stitchFeature)
         stitchedBody.name = 'Stitched_Body'
         # Cache the stitched body name
         stitchedBodyName = stitchedBody.name
@@ -320,11 +605,16 @@ def surfaceToSolid(selectedBody=None):
     combineInput.operation = adsk.fusion.FeatureOperations.CutFeatureOperation
     combineInput.isKeepToolBodies = True
     combineInput.isNewComponent = False
-    combineFeature = combineFeatures.add(combineInput)
+    with _stageTimer.span('combine'):
+        combineFeature = combineFeatures.add(combineInput)
+    if _evaluation:
+        _evaluation.created(combineFeature)
+    endDeferredCompute()
 
     if combineFeature:
         if combineFeature.bodies.count > 0:
             combinedBody = combineFeature.bodies.item(0)
+            touchBodies(combineFeature)
             combinedBody.name = 'Combined_Body'
 
             # Return the combined body
@@ -338,10 +628,16 @@ def surfaceToSolid(selectedBody=None):
 
 
 # Function to create a shell feature for a body.
-def createShellFeature(body, thickness, preUndo=True, iteration=None):
+def createShellFeature(body, thickness, preUndo=True, iteration=None, accuracy=LOW_ACCURACY):
+
+    # Defer compute so the deletions in the undo and the new shell are recomputed once
+    beginDeferredCompute()
 
     if preUndo:
-        if not undoShellFeatures():  # Undo the last features applied to the body in the last iteration
+        with _stageTimer.span('undo'):
+            undone = undoShellFeatures()  # Undo the last features applied to the body in the last iteration
+        if not undone:
+            endDeferredCompute()
             return None
 
     # Get the root component of the active design
@@ -349,10 +645,11 @@ def createShellFeature(body, thickness, preUndo=True, iteration=None):
     ui  = app.userInterface
     design = app.activeProduct
 
-    global _wasSurface
+    global _wasSurface, _builtThickness, _evaluation
     
     # Check if we have a valid design
     if not design or not isinstance(design, adsk.fusion.Design):
+        endDeferredCompute()
         debugToConsole('No active Fusion 360 design found.')
         return None
     
@@ -361,12 +658,15 @@ def createShellFeature(body, thickness, preUndo=True, iteration=None):
     
     # Check if there are any selected bodies
     if not body:
+        endDeferredCompute()
         debugToConsole('No bodies are selected.')
         return None
     
     if not body.isSolid:
-        debugToConsole(f'Body {body.name} is not a solid body and cannot be shelled.')
-        return None
+        endDeferredCompute()  # The undo may not have been computed yet
+        if not body.isSolid:
+            debugToConsole(f'Body {body.name} is not a solid body and cannot be shelled.')
+            return None
     
     # Create a collection of input entities for the shell feature
     inputEntities = adsk.core.ObjectCollection.create()
@@ -381,15 +681,21 @@ def createShellFeature(body, thickness, preUndo=True, iteration=None):
     shellFeatureInput.isTangentChain = True
 
     # Create the shell feature
-    shellFeature = activeComponent.features.shellFeatures.add(shellFeatureInput)
+    with _stageTimer.span('shell'):
+        shellFeature = activeComponent.features.shellFeatures.add(shellFeatureInput)
+
+    # The shell has to be computed to check whether it produced surface bodies
+    endDeferredCompute()
 
     # Check if the shell feature was created successfully
     if shellFeature:
-        # Check if any of the bodies in the design are not solid
-        for bRepBody in activeComponent.bRepBodies:
+        _evaluation = EvaluationContext(body, shellFeature)
+        # Check if the shelled body or any body the shell created is not solid
+        for bRepBody in shellBodies(_evaluation):
             if not bRepBody.isSolid:
                 bRepBody.name = 'Surface_Shell'
-                body = surfaceToSolid(selectedBody=body)  # Convert the surface body to a solid body
+                _evaluation.surfaceBodies.append(bRepBody)
+                body = surfaceToSolid(selectedBody=body, thickness=thickness)  # Convert the surface body to a solid body
                 if body:
                     _wasSurface = True
                     break
@@ -397,8 +703,9 @@ def createShellFeature(body, thickness, preUndo=True, iteration=None):
                     # debugToConsole(f'Failed to convert {bRepBody.name} to a solid body.')
                     return None
         debugToConsole(f'Successfully created a shell feature for {body.name}.')
+        _builtThickness = thickness
         # Return the mass of the shelled body
-        return weighComponent() # body.physicalProperties.mass
+        return weighComponent(_evaluation.touchedBodies, accuracy) # body.physicalProperties.mass
     else:
         if ui:
             if iteration:
@@ -408,25 +715,571 @@ def createShellFeature(body, thickness, preUndo=True, iteration=None):
         return None
 
 
-# Apply objective function
-def objectiveFunction(solidMass, body, thickness, preUndo=True, iteration=None):
+# Function to change the outside thickness of the existing shell feature and let Fusion recompute it.
+def updateShellFeature(body, thickness, iteration=None, accuracy=LOW_ACCURACY):
+    app = adsk.core.Application.get()
+    design = app.activeProduct
+
+    global _wasSurface, _builtThickness, _evaluation
+
+    # A shell left by another body is that body's result, so it is neither updated nor undone
+    if _evaluation and _evaluation.body != body:
+        return createShellFeature(body, thickness, preUndo=False, iteration=iteration, accuracy=accuracy)
+
+    # The surface fallback adds stitch and combine features downstream of the shell, so those evaluations are rebuilt
+    if not _evaluation or not _evaluation.hasShell() or _wasSurface:
+        return createShellFeature(body, thickness, preUndo=True, iteration=iteration, accuracy=accuracy)
+
+    try:
+        with _stageTimer.span('update'):
+            _evaluation.shellFeature.outsideThickness.expression = f'{thickness} mm'
+    except:
+        debugToConsole(f"Failed to update the shell thickness to {thickness} mm. Recreating the shell feature.\n{traceback.format_exc()}")
+        return createShellFeature(body, thickness, preUndo=True, iteration=iteration, accuracy=accuracy)
+
+    # Recreate the shell if the new thickness gives surface output that has to be stitched
+    for bRepBody in shellBodies(_evaluation):
+        if not bRepBody.isSolid:
+            debugToConsole(f"Shell thickness of {thickness} mm gave a surface body. Recreating the shell feature.")
+            _evaluation.shellFeature.deleteMe()
+            _evaluation, _builtThickness = None, None
+            return createShellFeature(body, thickness, preUndo=False, iteration=iteration, accuracy=accuracy)
+
+    _builtThickness = thickness
+    _evaluation = EvaluationContext(body, _evaluation.shellFeature)
+
+    return weighComponent(_evaluation.touchedBodies, accuracy)
+
+
+# Function to record which path an evaluation took, how long it took, the accuracy it was weighed at and whether the surface
+# fallback was predicted for it.
+def recordEvaluation(path, seconds, accuracy, surfaceFallbackUsed=False, predictedFallback=None):
+    global _lastEvaluation, _evaluationCounts, _lastPrediction
+
+    _lastEvaluation = (path, seconds, accuracy, surfaceFallbackUsed)
+    _lastPrediction = predictedFallback
+    _evaluationCounts[path] = _evaluationCounts.get(path, 0) + 1
+
+
+# Function to add a re-weigh of the shell already in the design to the last evaluation, keeping the path and time of the build
+# it re-weighs (e.g. a low accuracy build re-weighed at high accuracy within the same evaluation).
+def recordReweigh(seconds, accuracy, surfaceFallbackUsed=False):
+    global _lastEvaluation, _evaluationCounts
+
+    path, buildSeconds = _lastEvaluation[:2]
+    if not path:
+        path = 'Re-weigh'
+    elif not path.endswith('Re-weigh'):
+        path += ' + Re-weigh'
+    _lastEvaluation = (path, buildSeconds + seconds, accuracy, surfaceFallbackUsed)
+    _evaluationCounts['Re-weigh'] = _evaluationCounts.get('Re-weigh', 0) + 1
+
+
+# Function to get the selected evaluation mode.
+def selectedEvaluationMode():
+    global _evaluationMode
+
+    return _evaluationMode.selectedItem.name if _evaluationMode and _evaluationMode.selectedItem else RECREATE_MODE
+
+
+# Function to copy a body into a new scratch component that trial shells can run in without touching the user's body or the
+# features downstream of it. The scratch component is activated so the shell pipeline works on it unchanged.
+def createScratchBody(body):
+    app = adsk.core.Application.get()
+    design = app.activeProduct
+
+    global _scratch, _builtThickness, _evaluation, _wasSurface
+
+    # Check if we have a valid design
+    if not design or not isinstance(design, adsk.fusion.Design):
+        debugToConsole('No active Fusion 360 design found.')
+        return None
+
+    # The trial shells start afresh on the copy, so no shell on the user's body is updated, undone or re-weighed
+    _evaluation, _builtThickness, _wasSurface = None, None, False
+
+    previousOccurrence = design.activeOccurrence
+    occurrence = design.rootComponent.occurrences.addNewComponent(adsk.core.Matrix3D.create())
+    scratchComponent = occurrence.component
+    scratchComponent.name = 'Shell_Scratch'
+
+    # Copy the body as a history-free temporary body (parametric designs need a base feature to hold it)
+    tempBody = adsk.fusion.TemporaryBRepManager.get().copy(body)
+    if design.designType == adsk.fusion.DesignTypes.ParametricDesignType:
+        baseFeature = scratchComponent.features.baseFeatures.add()
+        baseFeature.startEdit()
+        scratchBody = scratchComponent.bRepBodies.add(tempBody, baseFeature)
+        baseFeature.finishEdit()
+        scratchBody = baseFeature.bodies.item(0) if baseFeature.bodies.count > 0 else scratchBody
+    else:
+        scratchBody = scratchComponent.bRepBodies.add(tempBody)
+
+    scratchBody.material = body.material
+    scratchBody.name = 'Selected_Body'
+
+    occurrence.activate()
+    _scratch = (occurrence, scratchBody, previousOccurrence)
+    debugToConsole(f"Copied {body.name} into the scratch component for the trial shells.")
+
+    return scratchBody
+
+
+# Function to delete the scratch component and reactivate the user's component.
+def removeScratchBody():
     app = adsk.core.Application.get()
+    design = app.activeProduct
+
+    global _scratch, _builtThickness, _evaluation, _wasSurface
+
+    if not _scratch:
+        return
+
+    occurrence, scratchBody, previousOccurrence = _scratch
+    _scratch = None
+
+    endDeferredCompute()
+    if previousOccurrence and previousOccurrence.isValid:
+        previousOccurrence.activate()
+    else:
+        design.activateRootComponent()
+    if occurrence.isValid:
+        occurrence.deleteMe()
+
+    # Nothing built in the scratch component is left in the design
+    _builtThickness, _evaluation, _wasSurface = None, None, False
+    debugToConsole("Removed the scratch component.")
+
+
+# Function to build the shell at a thickness with the selected evaluation mode, recording which path was taken and how long it took.
+def buildShell(body, thickness, preUndo=True, iteration=None, accuracy=LOW_ACCURACY):
+    global _fallbackPredictor
+
+    mode = selectedEvaluationMode()
+    predicted = _fallbackPredictor.predict(thickness) if _fallbackPredictor else None
+
+    t0 = timeit.default_timer()
+    if mode in (IN_PLACE_MODE, SCRATCH_MODE) and preUndo and not predicted:
+        # Trial shells in the scratch component are also updated in place
+        path = mode if _evaluation and _evaluation.hasShell() and not _wasSurface else RECREATE_MODE
+        shellMass = updateShellFeature(body, thickness, iteration=iteration, accuracy=accuracy)
+    else:
+        # A shell predicted to give surface output is recreated rather than updated, computed and then recreated anyway
+        path = RECREATE_MODE
+        shellMass = createShellFeature(body, thickness, preUndo=preUndo, iteration=iteration, accuracy=accuracy)
+    recordEvaluation(path, timeit.default_timer() - t0, accuracy, _wasSurface, predicted)
+
+    if predicted is not None and shellMass and _fallbackPredictor.record(thickness, predicted, _wasSurface):
+        message = f"Surface fallback {'predicted but not used' if predicted else 'used but not predicted'} at {thickness} mm. Fallback now predicted from {round(_fallbackPredictor.limit, 6)} mm.\n"
+        if _textLog:
+            _textLog.write(message)
+        debugToConsole(message)
+
+    return shellMass
+
+
+# Function to check whether the shell currently in the design is on the body and at the given thickness.
+def isBuiltAt(body, thickness):
+    if _builtThickness is None or not _evaluation or _evaluation.body != body:
+        return False
+    return _massCache.key(_builtThickness) == _massCache.key(thickness)
+
+
+# Function to re-weigh the shell already in the design at a higher accuracy without rebuilding it.
+def reweighShell(thickness, accuracy):
+    global _massCache, _wasSurface
+
+    t0 = timeit.default_timer()
+    shellMass = weighComponent(touchedBodies(), accuracy)
+    recordReweigh(timeit.default_timer() - t0, accuracy, _wasSurface)
+    if shellMass:
+        _massCache.put(thickness, shellMass, _wasSurface, accuracy)
 
-    shellMass = createShellFeature(body, thickness, preUndo=preUndo, iteration=iteration)
+    return shellMass
+
+
+# Function to get the shell mass at a thickness, only rebuilding the shell for thicknesses not already evaluated at the accuracy asked for.
+def evaluateShellMass(body, thickness, preUndo=True, iteration=None, accuracy=LOW_ACCURACY):
+    global _massCache, _wasSurface
+
+    entry = _massCache.get(thickness, accuracy)
+    if entry:
+        debugToConsole(f"Reusing cached mass for thickness {round(thickness, 6)} mm: {round(1e3*entry[1], 6)} g.")
+        recordEvaluation('Cached', 0.0, entry[3], entry[2])
+        return entry[1]
+
+    if isBuiltAt(body, thickness):
+        return reweighShell(thickness, accuracy)
+
+    shellMass = buildShell(body, thickness, preUndo=preUndo, iteration=iteration, accuracy=accuracy)
+    if shellMass:
+        _massCache.put(thickness, shellMass, _wasSurface, accuracy)
+
+    return shellMass
+
+
+# Function to get the shell mass at a thickness, weighing at low accuracy while far from the target mass and re-weighing at high
+# accuracy once the residual is within _accuracySwitch tolerances.
+def adaptiveShellMass(solidMass, body, thickness, preUndo=True, iteration=None):
+    global _adaptiveAccuracy, _accuracySwitch, _tolerance
+
+    shellMass = evaluateShellMass(body, thickness, preUndo=preUndo, iteration=iteration, accuracy=LOW_ACCURACY)
+    if _adaptiveAccuracy and shellMass and abs(shellMass - solidMass) < _accuracySwitch * _tolerance.value:
+        shellMass = evaluateShellMass(body, thickness, preUndo=preUndo, iteration=iteration, accuracy=HIGH_ACCURACY)
+
+    return shellMass
+
+
+# Function to leave the design shelled at the given thickness, rebuilding only if a different thickness is built.
+def buildShellAt(body, thickness, iteration=None, accuracy=LOW_ACCURACY):
+    global _massCache
+
+    if isBuiltAt(body, thickness):
+        entry = _massCache.get(thickness, accuracy)
+        if entry:
+            return entry[1]
+        return reweighShell(thickness, accuracy)
+
+    shellMass = buildShell(body, thickness, preUndo=True, iteration=iteration, accuracy=accuracy)
+    if shellMass:
+        _massCache.put(thickness, shellMass, _wasSurface, accuracy)
+
+    return shellMass
+
+
+# Class to hand the add-in's evaluation (the run's mass cache, adaptive accuracy and the selected evaluation mode) to the solvers
+# as a backend. Only evaluate is used: building, weighing and undoing shells stay with adaptiveShellMass and the functions it
+# calls. Every thickness is a full shell rebuild, so evaluateMany stays the sequential loop and the solvers do not sample-bracket.
+class FusionBackend(ShellBackends.GeometryBackend):
+    name = 'Fusion 360'
+
+    def __init__(self, body, solidMass):
+        super().__init__(_cacheQuantum)
+        self.body = body
+        self.solidMass = solidMass
+        self.lastSpan = (0.0, 0.0) # Start and end of the last evaluation, for the trace
+
+    def targetMass(self):
+        return self.solidMass
+
+    # Function to get the component mass at a thickness with the cache and adaptive accuracy.
+    def evaluate(self, thickness):
+        t0 = timeit.default_timer()
+        shellMass = adaptiveShellMass(self.solidMass, self.body, thickness, preUndo=True)
+        self.lastSpan = (t0, timeit.default_timer())
+        if not shellMass:
+            debugToConsole(f"Failed to apply outside shell feature for {self.body.name} with thickness {thickness} mm.")
+            return None
+        return shellMass
+
+
+# Function to get the objective function value and the shell mass it came from (None if the shell failed).
+def objectiveAndMass(solidMass, body, thickness, preUndo=True, iteration=None, step=None):
+    with _stageTimer.traceSpan(step or 'evaluate', 'solver', {'thickness': thickness}):
+        shellMass = adaptiveShellMass(solidMass, body, thickness, preUndo=preUndo, iteration=iteration)
+    logEvaluation(iteration, step, thickness, shellMass, solidMass)
     if shellMass:
-        return (shellMass - solidMass)**2
+        return (shellMass - solidMass)**2, shellMass
     else:
         debugToConsole(f"Failed to apply outside shell feature for {body.name} with thickness {thickness} mm.\nReturning a large objective function value.")
-        return 1e6 # None
+        return 1e6, None # None
+
+
+# Function to write an iteration to the log file and the console, with the path and time of the last shell evaluation and the
+# stage durations since the previous iteration.
+def logIteration(logPath, iteration, thickness, shellMass):
+    global _lastEvaluation, _stageTimer, _textLog
+
+    path, seconds, accuracy, _ = _lastEvaluation
+    stages = ShellTiming.StageTimer.formatIteration(_stageTimer.endIteration())
+    if shellMass:
+        message = f"Iteration: {iteration}\tThickness: {round(thickness, 6)} mm\t Mass: {round(1e3 * shellMass, 6)} g\tTime: {round(seconds, 3)} s ({path})\tAccuracy: {ACCURACY_NAMES[accuracy]}"
+    else:
+        message = f"Iteration: {iteration}\tThickness: {round(thickness, 6)} mm\t Mass: failed\tTime: {round(seconds, 3)} s ({path})\tAccuracy: {ACCURACY_NAMES[accuracy]}"
+    message += f"\tStages: {stages}\n" if stages else "\n"
+
+    # Write the iteration to the log file, then flush the log and the console output queued during the iteration
+    writeLog(logPath, message)
+    debugToConsole(message)
+    if _textLog:
+        _textLog.flush()
+
+
+# Function to write one shell evaluation to the structured run log, with the path, accuracy and stage durations it took.
+def logEvaluation(iteration, step, thickness, shellMass, solidMass):
+    global _runLog, _lastEvaluation, _lastPrediction, _stageTimer
+
+    stages = _stageTimer.endEvaluation()
+    if not _runLog:
+        return
+
+    path, seconds, accuracy, surfaceFallbackUsed = _lastEvaluation
+    _runLog.evaluation(iteration=iteration, step=step, thickness=thickness, mass=shellMass or None,
+                       residual=shellMass - solidMass if shellMass else None, path=path, accuracy=ACCURACY_NAMES[accuracy],
+                       cacheHit=path == 'Cached', surfaceFallback=bool(surfaceFallbackUsed), predictedFallback=_lastPrediction,
+                       seconds=seconds, stages=stages)
+
+
+# Function to close the structured run log with a footer.
+def closeRunLog(**fields):
+    global _runLog
+
+    if not _runLog:
+        return
+    try:
+        _runLog.footer(**fields)
+    finally:
+        _runLog.close()
+        _runLog = None
+
+
+# Function to estimate the shell thickness (mm) and a bracket around it from a mesh of the body, which gives the integrated mean
+# curvature the physical properties do not.
+def meshSeed(body):
+    global _meshSeed, _voxelSeed, _voxelResolution, _distanceField
+
+    _distanceField = None
+    if not _meshSeed or not ShellMesh:
+        return None
+
+    try:
+        physicalProperties = body.physicalProperties
+
+        calculator = body.meshManager.createMeshCalculator()
+        calculator.setQuality(adsk.fusion.TriangleMeshQualityOptions.NormalQualityTriangleMesh)
+        mesh = calculator.calculate()
+        vertices, faces = ShellMesh.fromFlatArrays(mesh.nodeCoordinatesAsDouble, mesh.nodeIndices, tolerance=1e-6)
+        meshProperties = ShellMesh.meshProperties(vertices, faces)
+
+        # Only trust the mesh if it reproduces the body's volume
+        if abs(meshProperties.volume - physicalProperties.volume) > 0.02 * physicalProperties.volume:
+            debugToConsole(f"Mesh volume {meshProperties.volume} cm^3 does not match the body volume {physicalProperties.volume} cm^3.")
+            return None
+
+        seed = None
+        if _voxelSeed and ShellSDF and meshProperties.concaveCurvature < 0:
+            # The outside offset self-intersects in concave regions, where the Steiner polynomial overestimates the shell volume
+            t0 = timeit.default_timer()
+            voxelSeed = ShellSDF.shellSeed(vertices, faces, physicalProperties.density, physicalProperties.mass, resolution=_voxelResolution)
+            if voxelSeed:
+                seed, _distanceField = voxelSeed[:2], voxelSeed[2]
+                debugToConsole(f"Voxel seed from {voxelSeed[2]} in {round(timeit.default_timer() - t0, 3)} s.")
+        if not seed:
+            seed = ShellMesh.steinerSeed(meshProperties, physicalProperties.density, physicalProperties.mass)
+    except:
+        debugToConsole(f"Mesh estimate failed, using the sphere estimate:\n{traceback.format_exc()}")
+        return None
+
+    if not seed:
+        return None
+    thickness, (lo, hi) = seed
+
+    # Fusion 360 reports lengths in cm, so scale the estimate to mm
+    return 10 * thickness, (10 * lo, 10 * hi)
+
+
+# Function to estimate the shell thickness (mm) and a bracket around it from the body's physical properties before any shell is built.
+def analyticSeed(body):
+    seed = meshSeed(body)
+    if seed:
+        return seed
+
+    physicalProperties = body.physicalProperties
+
+    # Fusion 360 reports lengths in cm, so scale the Steiner estimate to mm
+    seed = ShellEstimate.steinerSeed(physicalProperties.volume, physicalProperties.area, physicalProperties.mass, physicalProperties.density)
+    if not seed:
+        return None
+    thickness, (lo, hi) = seed
+
+    return 10 * thickness, (10 * lo, 10 * hi)
+
+
+# Function to get the radius (cm) of a face that is a concave cylinder, torus or sphere seen from outside the body, or None. The
+# face is concave if its outward normal points back towards the axis, tube centre or centre it curves around.
+def concaveRadius(face):
+    geometry = face.geometry
+    if not isinstance(geometry, (adsk.core.Cylinder, adsk.core.Torus, adsk.core.Sphere)):
+        return None
+
+    point = face.pointOnFace
+    found, normal = face.evaluator.getNormalAtPoint(point)
+    if not found:
+        return None
+
+    if isinstance(geometry, adsk.core.Sphere):
+        return geometry.radius if normal.dotProduct(geometry.origin.vectorTo(point)) < 0 else None
+
+    # Take the axial component out of the offset from the origin to get the radial direction
+    axis = geometry.axis.copy()
+    axis.normalize()
+    radial = geometry.origin.vectorTo(point)
+    axial = axis.copy()
+    axial.scaleBy(radial.dotProduct(axis))
+    radial.subtract(axial)
+
+    if isinstance(geometry, adsk.core.Cylinder):
+        return geometry.radius if normal.dotProduct(radial) < 0 else None
+
+    # A torus curves around the centre of its tube, which lies on the major circle
+    radial.normalize()
+    radial.scaleBy(geometry.majorRadius)
+    tubeCentre = geometry.origin.copy()
+    tubeCentre.translateBy(radial)
+    return geometry.minorRadius if normal.dotProduct(tubeCentre.vectorTo(point)) < 0 else None
+
+
+# Function to get the geometry the surface fallback depends on (mm): the smallest concave radius of the body's faces, the narrowest
+# gap from the voxel distance field if the mesh seed built one, and how many edges join tangent faces.
+def fallbackFeatures(body):
+    global _distanceField
+
+    radii = [radius for radius in (concaveRadius(face) for face in body.faces) if radius]
+
+    tangentEdges, edges = 0, 0
+    for edge in body.edges:
+        if edge.faces.count != 2:
+            continue
+        edges += 1
+        point = edge.pointOnEdge
+        normals = [face.evaluator.getNormalAtPoint(point) for face in edge.faces]
+        if all(found for found, _ in normals) and normals[0][1].dotProduct(normals[1][1]) > math.cos(math.radians(1)):
+            tangentEdges += 1
+
+    # Fusion 360 reports lengths in cm, so scale to mm
+    minGap = 10 * _distanceField.gapWidth() if _distanceField is not None else math.inf
+    return ShellFallback.FallbackFeatures(10 * min(radii) if radii else math.inf, minGap, tangentEdges, edges)
+
+
+# Function to set up the surface fallback predictor for a body and log the thickness it expects surface output from.
+def fallbackPredictor(body, logPath, bracket=None):
+    global _predictFallback
+
+    if not _predictFallback:
+        return None
+
+    try:
+        t0 = timeit.default_timer()
+        predictor = ShellFallback.FallbackPredictor(fallbackFeatures(body))
+    except:
+        debugToConsole(f"Surface fallback prediction failed:\n{traceback.format_exc()}")
+        return None
+
+    limit = predictor.limit
+    if math.isinf(limit):
+        message = "No surface fallback predicted."
+    else:
+        message = f"Surface fallback predicted from {round(limit, 6)} mm ({predictor.reason(limit)})."
+        if bracket and bracket[0] >= limit:
+            message += " The whole bracket is past it, so every trial shell is recreated."
+    message += f" Found in {round(timeit.default_timer() - t0, 3)} s.\n"
+    writeLog(logPath, message)
+    debugToConsole(message)
+
+    return predictor
+
+
+# Function to get the geometry fingerprint (volume, area and bounding box size) runs are matched on.
+def bodyFingerprint(body):
+    physicalProperties = body.physicalProperties
+    boundingBox = body.boundingBox
+    minPoint, maxPoint = boundingBox.minPoint, boundingBox.maxPoint
+    extents = (maxPoint.x - minPoint.x, maxPoint.y - minPoint.y, maxPoint.z - minPoint.z)
+    return ShellRunDatabase.Fingerprint(physicalProperties.volume, physicalProperties.area, extents)
+
+
+# Function to seed the solver from the stored run nearest the body's fingerprint, returning (thickness, (lo, hi), run id, distance)
+# or None.
+def warmStartSeed(token, fingerprint, density, logDir):
+    global _runDatabase, _runDatabaseName, _warmStartDistance
+
+    if not _runDatabase or not fingerprint:
+        return None
+
+    try:
+        runDatabase = ShellRunDatabase.RunDatabase(os.path.join(logDir, _runDatabaseName))
+        try:
+            return runDatabase.warmStart(fingerprint, density, token, _warmStartDistance)
+        finally:
+            runDatabase.close()
+    except:
+        debugToConsole(f"Run database lookup failed:\n{traceback.format_exc()}")
+        return None
+
+
+# Function to store a finished run with every (thickness, mass) pair weighed for the body, under the fingerprint and density the
+# body had before it was shelled.
+def storeRun(token, fingerprint, density, name, solidMass, mode, thickness, shellMass, iteration, seconds, logDir):
+    global _runDatabase, _runDatabaseName, _massCache
+
+    if not _runDatabase or not fingerprint:
+        return
+
+    try:
+        app = adsk.core.Application.get()
+        document = app.activeDocument.name if app.activeDocument else None
+        pairs = [(entry[0], entry[1]) for entry in _massCache.entries.values()]
+
+        runDatabase = ShellRunDatabase.RunDatabase(os.path.join(logDir, _runDatabaseName))
+        try:
+            runDatabase.recordRun(document, name, token, fingerprint, density, solidMass,
+                                  mode, thickness, shellMass, iteration, seconds, pairs)
+        finally:
+            runDatabase.close()
+    except:
+        debugToConsole(f"Failed to store the run:\n{traceback.format_exc()}")
+
+
+# Function to optimise the shell thickness with the original Nelder-Mead simplex on the squared mass error (legacy solver mode),
+# logging each iteration. The design is left at the best thickness once, by optimiseThickness.
+def legacyNelderMead(solidMass, body, logPath, initialThickness):
+    global _tolerance, _maxIterations
+
+    iterationStart = timeit.default_timer()
+
+    def evaluate(thickness, iteration, step):
+        return objectiveAndMass(solidMass, body, thickness, iteration=iteration, step=step)
+
+    def logSimplex(iteration, thickness, shellMass, simplex):
+        nonlocal iterationStart
+        debugToConsole(f"Simplex: {simplex}")
+        logIteration(logPath, iteration, thickness, shellMass)
+        _stageTimer.traceComplete(f'Iteration {iteration}', 'iteration', iterationStart, timeit.default_timer(), {'thickness': thickness})
+        iterationStart = timeit.default_timer()
+
+    return ShellSolvers.legacyNelderMead(evaluate, solidMass, initialThickness, _tolerance.value, _maxIterations.value, callback=logSimplex)
+
+
+# Function to optimise the shell thickness by root finding on the signed residual shellMass - solidMass.
+def rootFindThickness(solidMass, body, logPath, mode, initialThickness, bracket=None):
+    global _tolerance, _maxIterations, _cacheQuantum, _stageTimer
+
+    backend = FusionBackend(body, solidMass)
+
+    def onEvaluation(evaluation, thickness, value, step):
+        # Each evaluation is one iteration, so the iteration and solver step spans cover the same stages
+        start, end = backend.lastSpan
+        _stageTimer.traceComplete(f'Iteration {evaluation}', 'iteration', start, end, {'thickness': thickness, 'residual': value})
+        _stageTimer.traceComplete(step, 'solver', start, end, {'thickness': thickness})
+        logEvaluation(evaluation, step, thickness, None if value is None else value + solidMass, solidMass)
+        logIteration(logPath, evaluation, thickness, None if value is None else value + solidMass)
+
+    result = ShellBackends.optimise(backend, mode, initialThickness, _tolerance.value, _cacheQuantum, _maxIterations.value, bracket=bracket, callback=onEvaluation)
+    if result.message:
+        debugToConsole(f"{mode} solver stopped: {result.message}")
+    if result.thickness is None:
+        raise Exception(f"{mode} solver could not evaluate any shell thickness.")
+
+    return result.thickness, result.residual + solidMass, result.evaluations
 
 
 # Function to optimise the shell thickness of a body to retain the body's mass.
 def optimiseThickness(eventArgs, bodies=None):
     app = adsk.core.Application.get()
     ui  = app.userInterface
+    logPath = None
 
     try:
-        global _initialThickness, _tolerance, _maxIterations, _errMessage, _undoTest
+        global _initialThickness, _tolerance, _maxIterations, _errMessage, _undoTest, _massCache, _runDatabase, _solverMode, _analyticSeed, _stageTimer, _traceEnabled, _adaptiveAccuracy, _evaluationCounts, _structuredLog, _runLog, _textLog, _distanceField, _fallbackPredictor, _evaluation, _builtThickness, _wasSurface
 
         _initialThickness.value *= 10 # Convert from mm to cm (bodge)
         
@@ -437,7 +1290,23 @@ def optimiseThickness(eventArgs, bodies=None):
         # Optimise the shell thickness of each selected body
         for body in bodies:
 
+            # Forget the previous body's evaluation, so its finished shell is neither deleted, updated nor re-weighed for this one
+            _evaluation, _builtThickness, _wasSurface = None, None, False
+
             cachedName = body.name
+
+            # Drop cached masses if the body or its upstream timeline has changed since the last run
+            if not _massCache.validate(designSignature(body)):
+                debugToConsole(f"Mass cache reset for {cachedName}.")
+
+            # Fingerprint the body before any shell is built, so runs are stored and looked up on the solid body
+            token, fingerprint, density = body.entityToken, None, None
+            if _runDatabase:
+                try:
+                    fingerprint, density = bodyFingerprint(body), body.physicalProperties.density
+                except:
+                    debugToConsole(f"Failed to fingerprint {cachedName}:\n{traceback.format_exc()}")
+
             body.name = 'Selected_Body'
             
             # Check if 'log' directory exists
@@ -446,122 +1315,122 @@ def optimiseThickness(eventArgs, bodies=None):
             if not os.path.exists(logDir):
                 os.makedirs(logDir)
 
-            # Get the mass of the body
-            solidMass = weighComponent() # body.physicalProperties.mass # + 11e-3 # Add 11 g to account for the mass lost in the combine feature
+            # Record the masses of the bodies that will not change, then get the mass of the whole component
+            reportAccuracy = VERY_HIGH_ACCURACY if _adaptiveAccuracy else LOW_ACCURACY
+            recordUntouchedBodies(body, reportAccuracy)
+            solidMass = weighComponent(accuracy=reportAccuracy) # body.physicalProperties.mass # + 11e-3 # Add 11 g to account for the mass lost in the combine feature
 
             # Create a logging file
             now = datetime.datetime.now()
             logName = f"{cachedName}_{now.strftime('%d-%m-%Y_%H-%M-%S')}.txt"
             logPath = os.path.join(logDir, logName)
             startMessage = f"Optimisation of {cachedName} shell thickness to maintain mass of {round(1e3*solidMass, 6)} g.\n{now.strftime('%d-%m-%Y %H:%M:%S')}\n"
-            with open(logPath, 'w') as logFile:
-                logFile.write(startMessage)
-
-            textPalette = ui.palettes.itemById('TextCommands')
-            if not textPalette.isVisible:
-                textPalette.isVisible = True  # Open the Text Command window if it's not already open
-            textPalette.writeText(startMessage)
-
-            # Setup the Nelder-Mead optimisation algorithm
+            _textLog = ShellRunLog.TextLog(logPath, textCommandsPalette())
+            _textLog.write(startMessage, echo=True)
+            _textLog.flush()
+
+            # Start from the nearest previous run if there is one, otherwise estimate the thickness from the body's area, volume
+            # and density before building any shell
+            initialThickness, bracket = _initialThickness.value, None
+            seedMessage, _distanceField = None, None
+            warmStart = warmStartSeed(token, fingerprint, density, logDir)
+            if warmStart:
+                initialThickness, bracket, run, distance = warmStart
+                seedMessage = f"Warm start from run {run} (fingerprint difference {round(100 * distance, 3)} %): {round(initialThickness, 6)} mm\tBracket: {round(bracket[0], 6)} - {round(bracket[1], 6)} mm\n"
+            else:
+                seed = analyticSeed(body) if _analyticSeed else None
+                if seed:
+                    initialThickness, bracket = seed
+                    seedMessage = f"Analytic first guess: {round(initialThickness, 6)} mm\tBracket: {round(bracket[0], 6)} - {round(bracket[1], 6)} mm\n"
+            if seedMessage:
+                writeLog(logPath, seedMessage)
+                debugToConsole(seedMessage)
+            # Recreate mode rebuilds every trial shell whatever is predicted, so the face and edge scan is only worth it in the
+            # modes that update shells in place
+            _fallbackPredictor = fallbackPredictor(body, logPath, bracket) if selectedEvaluationMode() != RECREATE_MODE else None
+
+            # Run the selected solver
+            _stageTimer.reset()
+            _evaluationCounts.clear()
+            _stageTimer.trace = ShellTiming.TraceWriter(f"Shell Optimisation: {cachedName}") if _traceEnabled else None
             t0 = timeit.default_timer()
-            alpha, gamma, rho, sigma = 1.0, 2.0, 0.5, 0.5 # Reflection, expansion, contraction, shrinkage
-            simplex = [_initialThickness.value, _initialThickness.value*1.1, _initialThickness.value*1.2]
-            # simplex = [1.5153125, 1.5010937499999994, 1.5158203124999994]
-            iteration, iterations = 0, []
-
-            # get initial simplex values
+            mode = _solverMode.selectedItem.name if _solverMode and _solverMode.selectedItem else ShellSolvers.BRENT
+
+            if _structuredLog:
+                _runLog = ShellRunLog.RunLog(ShellRunLog.RunLog.pathFor(logPath, _structuredLog), _structuredLog)
+                _runLog.header(body=cachedName, targetMass=solidMass, tolerance=_tolerance.value, maxIterations=_maxIterations.value,
+                               solver=mode, evaluationMode=selectedEvaluationMode(), initialThickness=initialThickness, bracket=bracket,
+                               warmStartRun=warmStart[2] if warmStart else None)
+            _stageTimer.endEvaluation()
+
+            # Run the trial shells on a scratch copy of the body if selected, only the converged shell is built on the user's body
+            evaluationBody = body
+            if selectedEvaluationMode() == SCRATCH_MODE:
+                evaluationBody = createScratchBody(body) or body
             try:
-                simplex_values = []
-                for thickness in simplex:
-                    value = objectiveFunction(solidMass, body, thickness, iteration=iteration)
-                    simplex_values.append(value)
-            except Exception as inner_e:
-                raise Exception(f"Failed to evaluate objective function for thickness {thickness} mm:\n{inner_e}")
-
-            while iteration <= _maxIterations.value:
-                # Sort the simplex values
-                sorted_indices = sorted(range(len(simplex_values)), key=lambda i: simplex_values[i]) # This is where the error is
-                simplex = [simplex[i] for i in sorted_indices]
-                simplex_values = [simplex_values[i] for i in sorted_indices]
-                
-                centroid = sum(simplex[:-1]) / len(simplex[:-1])
-                
-                # Reflection
-                reflected_thickness = centroid + alpha * (centroid - simplex[-1])
-                reflected_value = objectiveFunction(solidMass, body, reflected_thickness, iteration=iteration)
-                
-                if simplex_values[0] <= reflected_value < simplex_values[-2]:
-                    simplex[-1] = reflected_thickness
-                    simplex_values[-1] = reflected_value
-                # Expansion
-                elif reflected_value < simplex_values[0]:
-                    expanded_thickness = centroid + gamma * (reflected_thickness - centroid)
-                    expanded_value = objectiveFunction(solidMass, body, reflected_thickness, iteration=iteration)
-                    if expanded_value < reflected_value:
-                        simplex[-1] = expanded_thickness
-                        simplex_values[-1] = expanded_value
-                    else:
-                        simplex[-1] = reflected_thickness
-                        simplex_values[-1] = reflected_value
-                # Outside contraction
-                elif simplex_values[-2] <= reflected_value < simplex_values[-1]:
-                    # Contraction
-                    contracted_thickness = centroid + rho * (simplex[-1] - centroid)
-                    contracted_value = objectiveFunction(solidMass, body, reflected_thickness, iteration=iteration)
-                    if contracted_value < simplex_values[-1]:
-                        simplex[-1] = contracted_thickness
-                        simplex_values[-1] = contracted_value
-                    # Shrink
-                    else:
-                        for i in range(1, len(simplex)):
-                            simplex[i] = simplex[0] + sigma * (simplex[i] - simplex[0])
-                            simplex_values[i] = objectiveFunction(solidMass, body, reflected_thickness, iteration=iteration)
-                # Inside contraction
-                elif reflected_value >= simplex_values[-1]:
-                    contracted_thickness = centroid - rho * (simplex[-1] - centroid)
-                    contracted_value = objectiveFunction(solidMass, body, reflected_thickness, iteration=iteration)
-                    if contracted_value < simplex_values[-1]:
-                        simplex[-1] = contracted_thickness
-                        simplex_values[-1] = contracted_value
-                    # Shrink
-                    else:
-                        for i in range(1, len(simplex)):
-                            simplex[i] = simplex[0] + sigma * (simplex[i] - simplex[0])
-                            simplex_values[i] = objectiveFunction(solidMass, body, reflected_thickness, iteration=iteration)
-                
-                debugToConsole(f"Simplex: {simplex}")
-                
-                t1 = timeit.default_timer()
-                iterations.append(simplex[0])
-                iteration += 1
-
-                shellMass = createShellFeature(body, simplex[0], preUndo=True, iteration=iteration)
-                message = f"Iteration: {iteration}\tThickness: {round(simplex[0], 6)} mm\t Mass: {round(1e3 * shellMass, 6)} g\n"
-                # Write the iteration to the log file
-                with open(logPath, 'a') as logFile:
-                    logFile.write(message)
-                
-                debugToConsole(message)
+                if mode == ShellSolvers.LEGACY_NELDER_MEAD:
+                    thickness, shellMass, iteration = legacyNelderMead(solidMass, evaluationBody, logPath, initialThickness)
+                else:
+                    thickness, shellMass, iteration = rootFindThickness(solidMass, evaluationBody, logPath, mode, initialThickness, bracket=bracket)
+            finally:
+                removeScratchBody()
+                fallbackPrediction = _fallbackPredictor.summary() if _fallbackPredictor else None
+                _fallbackPredictor = None # The final shell is built on the user's body as it comes
+            t1 = timeit.default_timer()
 
-                # Check convergence
-                if abs(shellMass - solidMass) < _tolerance.value:
-                    break
+            # Leave the design shelled at the optimal thickness
+            with _stageTimer.traceSpan('Final shell', 'iteration', {'thickness': thickness}):
+                shellMass = buildShellAt(body, thickness, iteration=iteration, accuracy=reportAccuracy)
 
             body.name = cachedName
 
-            debugToConsole(f"Nelder-Mead shell thickness optimisation completed in {iteration} iterations and {round(t1-t0, 3)} seconds.\nOptimal shell thickness for {body.name} is {round(simplex[0], 4)} mm.\nInitial mass: {round(1e3*solidMass, 6)} g\nFinal mass: {round(1e3*shellMass, 6)} g.")
+            storeRun(token, fingerprint, density, cachedName, solidMass, mode, thickness, shellMass, iteration, t1 - t0, logDir)
+            closeRunLog(thickness=thickness, mass=shellMass, iterations=iteration, seconds=t1 - t0, finalAccuracy=ACCURACY_NAMES[reportAccuracy],
+                        evaluationPaths=dict(_evaluationCounts), stages={stage: total for stage, _, total, _, _ in _stageTimer.summary()},
+                        fallbackPrediction=fallbackPrediction)
+
+            debugToConsole(f"{mode} shell thickness optimisation completed in {iteration} iterations and {round(t1-t0, 3)} seconds.\nOptimal shell thickness for {body.name} is {round(thickness, 4)} mm.\nInitial mass: {round(1e3*solidMass, 6)} g\nFinal mass: {round(1e3*shellMass, 6)} g.")
 
             # Finish the log file
-            with open(logPath, 'a') as logFile:
-                logFile.write(f"\nOptimal shell thickness for {body.name} is {round(simplex[0], 6)} mm.\nInitial mass: {round(1e3*solidMass, 6)} g\tFinal mass: {round(1e3*shellMass, 6)} g\nOptimisation completed in {iteration} iterations and {round(t1-t0, 3)} seconds.")
+            writeLog(logPath, f"\nOptimal shell thickness for {body.name} is {round(thickness, 6)} mm.\nInitial mass: {round(1e3*solidMass, 6)} g\tFinal mass: {round(1e3*shellMass, 6)} g\nOptimisation completed in {iteration} iterations and {round(t1-t0, 3)} seconds using the {mode} solver.\nEvaluations: {', '.join(f'{path} {count}' for path, count in _evaluationCounts.items())}\tFinal mass accuracy: {ACCURACY_NAMES[reportAccuracy]}")
+            if fallbackPrediction and fallbackPrediction['predictions']:
+                writeLog(logPath, f"\nSurface fallback predictions: {fallbackPrediction['predictions']}\tWrong: {fallbackPrediction['wrong']} ({fallbackPrediction['missedFallbacks']} missed, {fallbackPrediction['falseFallbacks']} false)")
+            writeLog(logPath, f"\n\nStage timings:\n{_stageTimer.summaryTable()}\n")
+            debugToConsole(f"Stage timings:\n{_stageTimer.summaryTable()}")
+
+            # Flush the buffered trace next to the log
+            if _stageTimer.trace:
+                tracePath = os.path.splitext(logPath)[0] + '.trace.json'
+                _stageTimer.trace.write(tracePath)
+                _stageTimer.trace = None
+                debugToConsole(f"Trace written to {tracePath}.")
+
+            closeTextLog()
     
     except:
+        # Never leave the design with compute deferred
+        try:
+            endDeferredCompute()
+        except:
+            pass
+        # write error to log file if it exists, flushing everything buffered before the message box blocks
+        if logPath:
+            writeLog(logPath, f"\nFailed:\n{traceback.format_exc()}")
+        try:
+            closeTextLog()
+        except:
+            pass
         if ui:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
-        # write error to log file if it exists
         if logPath:
-            with open(logPath, 'a') as logFile:
-                logFile.write(f"\nFailed:\n{traceback.format_exc()}")
+            if _stageTimer.trace:
+                _stageTimer.trace.write(os.path.splitext(logPath)[0] + '.trace.json')
+                _stageTimer.trace = None
+        try:
+            closeRunLog(error=traceback.format_exc())
+        except:
+            pass
+        _fallbackPredictor = None
         stop(None)
 
 
@@ -665,7 +1534,7 @@ class EventHandler(adsk.core.CommandCreatedEventHandler):
             event_args = adsk.core.CommandCreatedEventArgs.cast(args)
 
             # Call global variables that are being editted within the class
-            global _initialThickness, _tolerance, _maxIterations, _errMessage, _bodySelection
+            global _initialThickness, _tolerance, _maxIterations, _errMessage, _bodySelection, _solverMode, _evaluationMode
 
             cmd = args.command
             cmd.isExecutedWhenPreEmpted = False
@@ -688,6 +1557,16 @@ class EventHandler(adsk.core.CommandCreatedEventHandler):
             # Create an integer spinner for the max iterations
             _maxIterations = inputs.addIntegerSpinnerCommandInput('maxIterations', 'Max Iterations', 1, 500, 10, 50)
 
+            # Create a drop down for the solver
+            _solverMode = inputs.addDropDownCommandInput('solverMode', 'Solver', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for mode in ShellSolvers.SOLVER_MODES:
+                _solverMode.listItems.add(mode, mode == ShellSolvers.BRENT, '')
+
+            # Create a drop down for how each thickness is evaluated
+            _evaluationMode = inputs.addDropDownCommandInput('evaluationMode', 'Evaluation Mode', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for mode in EVALUATION_MODES:
+                _evaluationMode.listItems.add(mode, mode == RECREATE_MODE, '')
+
             # Error message input
             _errMessage = inputs.addTextBoxCommandInput('errMessage', '', '', 2, True)
             _errMessage.isFullWidth = True
@@ -0,0 +1,111 @@
+#Description: Persistent record of optimisation runs for warm-starting repeat optimisations.
+
+"""Runs are stored in SQLite with a geometry fingerprint, and a new run is seeded from the nearest stored run's curve."""
+
+import datetime, sqlite3
+
+
+# Class to hold the scale of a body (volume, surface area and bounding box extents) for matching runs across design edits.
+class Fingerprint:
+    def __init__(self, volume, area, extents):
+        self.volume = volume
+        self.area = area
+        self.extents = tuple(extents) # Bounding box size along x, y and z
+
+    def __repr__(self):
+        return f"Fingerprint(volume={self.volume}, area={self.area}, extents={self.extents})"
+
+    # Function to get the largest relative difference between two fingerprints (0 for identical bodies).
+    def distance(self, other):
+        pairs = [(self.volume, other.volume), (self.area, other.area)] + list(zip(self.extents, other.extents))
+        return max(abs(a - b) / max(abs(a), abs(b), 1e-12) for a, b in pairs)
+
+
+# Class to read and write optimisation runs in a SQLite database file.
+class RunDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                created TEXT,
+                document TEXT,
+                body TEXT,
+                token TEXT,
+                volume REAL,
+                area REAL,
+                extentX REAL,
+                extentY REAL,
+                extentZ REAL,
+                density REAL,
+                targetMass REAL,
+                solver TEXT,
+                thickness REAL,
+                mass REAL,
+                evaluations INTEGER,
+                seconds REAL
+            );
+            CREATE TABLE IF NOT EXISTS evaluations (
+                run INTEGER REFERENCES runs(id),
+                thickness REAL,
+                mass REAL
+            );
+            CREATE INDEX IF NOT EXISTS evaluationsByRun ON evaluations(run);
+        ''')
+
+    def close(self):
+        self.connection.close()
+
+    # Function to store a finished run and its evaluated (thickness, mass) pairs in one transaction, returning the run id.
+    def recordRun(self, document, body, token, fingerprint, density, targetMass, solver, thickness, mass, evaluations, seconds, pairs):
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO runs (created, document, body, token, volume, area, extentX, extentY, extentZ, density, targetMass, '
+                'solver, thickness, mass, evaluations, seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (datetime.datetime.now().isoformat(), document, body, token, fingerprint.volume, fingerprint.area, *fingerprint.extents,
+                 density, targetMass, solver, thickness, mass, evaluations, seconds))
+            run = cursor.lastrowid
+            self.connection.executemany('INSERT INTO evaluations (run, thickness, mass) VALUES (?, ?, ?)',
+                                        [(run, t, m) for t, m in pairs if m is not None])
+        return run
+
+    # Function to find the stored run nearest a fingerprint at the same density, returning (run id, distance) or None. Runs on
+    # the same body win ties, and newer runs win ties between those.
+    def nearestRun(self, fingerprint, density, token=None, maxDistance=0.05):
+        rows = self.connection.execute(
+            'SELECT id, token, volume, area, extentX, extentY, extentZ FROM runs WHERE ABS(density - ?) <= 1e-9 * ABS(?) ORDER BY id DESC',
+            (density, density))
+        best = None
+        for run, runToken, volume, area, x, y, z in rows:
+            distance = fingerprint.distance(Fingerprint(volume, area, (x, y, z)))
+            rank = (distance, runToken != token)
+            if distance <= maxDistance and (best is None or rank < best[0]):
+                best = (rank, run, distance)
+        return best and (best[1], best[2])
+
+    # Function to get a run's target mass, result thickness and its (thickness, mass) curve sorted by thickness.
+    def runCurve(self, run):
+        targetMass, thickness = self.connection.execute('SELECT targetMass, thickness FROM runs WHERE id = ?', (run,)).fetchone()
+        pairs = self.connection.execute('SELECT thickness, mass FROM evaluations WHERE run = ? ORDER BY thickness', (run,)).fetchall()
+        return targetMass, thickness, pairs
+
+    # Function to seed a new run from the nearest stored run, returning (thickness, (lo, hi), run id, distance) or None. The seed
+    # is the stored curve's crossing of its target mass, and the bracket is tighter the closer the fingerprints are.
+    def warmStart(self, fingerprint, density, token=None, maxDistance=0.05, minMargin=0.005):
+        match = self.nearestRun(fingerprint, density, token, maxDistance)
+        if not match:
+            return None
+        run, distance = match
+        targetMass, thickness, pairs = self.runCurve(run)
+        if thickness is None:
+            return None
+
+        # Interpolate the curve where it crosses the stored target nearest the stored result, falling back to the stored result
+        crossings = [t0 + (targetMass - m0) * (t1 - t0) / (m1 - m0) for (t0, m0), (t1, m1) in zip(pairs, pairs[1:])
+                     if (m0 - targetMass) * (m1 - targetMass) <= 0 and m1 != m0]
+        if crossings:
+            thickness = min(crossings, key=lambda t: abs(t - thickness))
+
+        margin = max(2 * distance, minMargin)
+        return thickness, ((1 - margin) * thickness, (1 + margin) * thickness), run, distance
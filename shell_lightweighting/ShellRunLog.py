@@ -0,0 +1,99 @@
+#Description: Machine-readable run log for the shell thickness optimiser.
+
+"""One record per shell evaluation between a header and a footer, as JSON Lines or CSV, plus the buffered text log."""
+
+import csv, datetime, json, os
+
+# Log formats.
+JSONL = 'jsonl'
+CSV = 'csv'
+LOG_FORMATS = [JSONL, CSV]
+
+# Columns of an evaluation record, in CSV column order.
+EVALUATION_FIELDS = ['iteration', 'step', 'thickness', 'mass', 'residual', 'path', 'accuracy', 'cacheHit', 'surfaceFallback', 'predictedFallback', 'seconds', 'stages']
+
+
+# Class to write the header, evaluation records and footer of one run to a JSON Lines or CSV file.
+class RunLog:
+    def __init__(self, path, logFormat=JSONL, bufferSize=1 << 16):
+        if logFormat not in LOG_FORMATS:
+            raise ValueError(f"Unknown run log format: {logFormat}")
+        self.path = path
+        self.logFormat = logFormat
+        self.records = 0
+        self.file = open(path, 'w', buffering=bufferSize, newline='')
+        self.writer = None
+        if logFormat == CSV:
+            self.writer = csv.DictWriter(self.file, fieldnames=EVALUATION_FIELDS, extrasaction='ignore')
+
+    # Function to get the path of the structured log next to a text log.
+    @staticmethod
+    def pathFor(textLogPath, logFormat=JSONL):
+        return os.path.splitext(textLogPath)[0] + '.' + logFormat
+
+    # Function to write the run header (body, target mass, solver, seed, ...).
+    def header(self, **fields):
+        fields = {'record': 'header', 'started': datetime.datetime.now().isoformat(), 'units': {'thickness': 'mm', 'mass': 'kg'}, **fields}
+        if self.writer:
+            # CSV readers skip the header and footer as comment lines (e.g. pandas.read_csv(path, comment='#'))
+            self.file.write(f"# {json.dumps(fields)}\n")
+            self.writer.writeheader()
+        else:
+            self.file.write(json.dumps(fields) + '\n')
+
+    # Function to write one evaluation record.
+    def evaluation(self, **fields):
+        self.records += 1
+        if self.writer:
+            if 'stages' in fields:
+                fields['stages'] = json.dumps(fields['stages'])
+            self.writer.writerow(fields)
+        else:
+            self.file.write(json.dumps({'record': 'evaluation', **fields}) + '\n')
+
+    # Function to write the run footer (result, evaluation counts, stage summary or the error).
+    def footer(self, **fields):
+        fields = {'record': 'footer', 'finished': datetime.datetime.now().isoformat(), 'evaluations': self.records, **fields}
+        if self.writer:
+            self.file.write(f"# {json.dumps(fields)}\n")
+        else:
+            self.file.write(json.dumps(fields) + '\n')
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+# Class to write the human-readable text log through one buffered file handle and hold console output (for any object with
+# writeText, e.g. the TextCommands palette) until the next flush, so a run costs one console write per iteration.
+class TextLog:
+    def __init__(self, path, console=None, bufferSize=1 << 16):
+        self.path = path
+        self.console = console
+        self.pending = []
+        self.file = open(path, 'w', buffering=bufferSize)
+
+    # Function to write text to the log file, and to the console at the next flush if echo is set.
+    def write(self, text, echo=False):
+        self.file.write(text)
+        if echo:
+            self.echo(text)
+
+    # Function to queue text for the console.
+    def echo(self, text):
+        self.pending.append(text)
+
+    # Function to push the file buffer to disk and the queued text to the console in a single write.
+    def flush(self):
+        self.file.flush()
+        if self.pending and self.console:
+            self.console.writeText(''.join(self.pending))
+        self.pending = []
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
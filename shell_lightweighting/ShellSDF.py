@@ -0,0 +1,219 @@
+#Description: Voxel signed distance field shell volume engine for non-convex bodies.
+
+"""Voxelises a closed mesh and sorts the outside distances once, giving the shell volume at any number of thicknesses for
+concave parts where the Steiner polynomial breaks down. Needs NumPy."""
+
+import math, os, sys
+
+import numpy as np
+
+from . import ShellMesh
+
+
+# Function to voxelise a closed mesh into a boolean occupancy grid whose voxel centres are origin + index * pitch.
+def voxelise(vertices, faces, pitch, padding=0.0):
+    vertices = np.asarray(vertices, dtype=float)
+    faces = np.asarray(faces, dtype=np.int64)
+
+    origin = vertices.min(axis=0) - padding
+    shape = tuple(int(n) for n in np.ceil((vertices.max(axis=0) + padding - origin) / pitch).astype(int) + 1)
+
+    # Cast one ray along +z through every column, nudged off the grid so rays do not run exactly along mesh edges
+    nudge = pitch * np.array([1.3e-6, 2.9e-6])
+    v0, v1, v2 = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    corners = np.stack([v0, v1, v2])
+    lo = np.ceil((corners[:, :, :2].min(axis=0) - origin[:2] - nudge) / pitch).astype(np.int64)
+    hi = np.floor((corners[:, :, :2].max(axis=0) - origin[:2] - nudge) / pitch).astype(np.int64)
+    lo = np.maximum(lo, 0)
+    hi = np.minimum(hi, np.array(shape[:2]) - 1)
+    spans = np.maximum(hi - lo + 1, 0)
+    counts = spans[:, 0] * spans[:, 1]
+
+    # Expand every triangle into the columns under its bounding box
+    triangle = np.repeat(np.arange(len(faces)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    ix = lo[triangle, 0] + local % spans[triangle, 0]
+    iy = lo[triangle, 1] + local // spans[triangle, 0]
+    x = origin[0] + ix * pitch + nudge[0]
+    y = origin[1] + iy * pitch + nudge[1]
+
+    # Barycentric weights of the column in the triangle's xy projection
+    a, b, c = v0[triangle], v1[triangle], v2[triangle]
+    w0 = (b[:, 0] - x) * (c[:, 1] - y) - (b[:, 1] - y) * (c[:, 0] - x)
+    w1 = (c[:, 0] - x) * (a[:, 1] - y) - (c[:, 1] - y) * (a[:, 0] - x)
+    w2 = (a[:, 0] - x) * (b[:, 1] - y) - (a[:, 1] - y) * (b[:, 0] - x)
+    total = w0 + w1 + w2
+    hit = (total != 0) & (((w0 >= 0) & (w1 >= 0) & (w2 >= 0)) | ((w0 <= 0) & (w1 <= 0) & (w2 <= 0)))
+    z = (w0[hit] * a[hit, 2] + w1[hit] * b[hit, 2] + w2[hit] * c[hit, 2]) / total[hit]
+
+    # Toggle occupancy at the first voxel above every crossing; the running parity up each column is the inside test
+    iz = np.ceil((z - origin[2]) / pitch).astype(np.int64)
+    keep = iz < shape[2]
+    toggles = np.zeros(shape, dtype=np.int32)
+    np.add.at(toggles, (ix[hit][keep], iy[hit][keep], np.maximum(iz[keep], 0)), 1)
+
+    return np.cumsum(toggles, axis=2) % 2 == 1, origin
+
+
+# Function to get the index of the nearest feature voxel at or before and at or after every voxel along one axis (-inf and inf
+# where there is none), and the voxel indices along that axis.
+def _lineNeighbours(features, axis):
+    shape = [1] * features.ndim
+    shape[axis] = features.shape[axis]
+    index = np.arange(features.shape[axis], dtype=np.float32).reshape(shape)
+
+    before = np.maximum.accumulate(np.where(features, index, -np.inf), axis=axis)
+    after = np.flip(np.minimum.accumulate(np.flip(np.where(features, index, np.inf), axis=axis), axis=axis), axis=axis)
+    return before, after, index
+
+
+# Function to get the squared distance (in voxels) to the nearest feature voxel along one axis, from running index scans.
+def _lineDistance(features, axis):
+    before, after, index = _lineNeighbours(features, axis)
+    return np.square(np.minimum(index - before, after - index))
+
+
+# Function to take the lower envelope min_j f[j] + (i - j)^2 along one axis over |i - j| <= radius. The shifted copies go
+# through one scratch array so no temporaries are allocated per offset.
+def _envelopePass(squared, axis, radius):
+    result = squared.copy()
+    shifted = np.empty_like(squared)
+
+    def along(start, stop):
+        index = [slice(None)] * squared.ndim
+        index[axis] = slice(start, stop)
+        return tuple(index)
+
+    for k in range(1, min(radius, squared.shape[axis] - 1) + 1):
+        np.add(squared[along(None, -k)], k * k, out=shifted[along(None, -k)])
+        np.minimum(result[along(k, None)], shifted[along(None, -k)], out=result[along(k, None)])
+        np.add(squared[along(k, None)], k * k, out=shifted[along(k, None)])
+        np.minimum(result[along(None, -k)], shifted[along(k, None)], out=result[along(None, -k)])
+
+    return result
+
+
+# Function to get the squared Euclidean distance (in voxels) from every voxel to the nearest feature voxel. The transform is
+# separable: an exact scan along the last (strided) axis, then envelopes along the others that are exact for distances up to
+# the radius; anything further is left at or above radius^2.
+def squaredDistanceTransform(features, radius):
+    squared = _lineDistance(features, features.ndim - 1).astype(np.float32)
+    for axis in range(features.ndim - 2, -1, -1):
+        squared = _envelopePass(squared, axis, radius)
+    return squared
+
+
+# Class to hold a voxel signed distance field and the shell volume against thickness curve it defines.
+class DistanceField:
+    def __init__(self, inside, origin, pitch, radius):
+        self.inside = inside
+        self.origin = origin
+        self.pitch = pitch
+        self.radius = radius
+        self.maxThickness = (radius - 0.5) * pitch # Largest thickness the truncated transform is exact for
+        self.voxelVolume = pitch ** 3
+        self.volume = float(inside.sum()) * self.voxelVolume
+
+        # Distance from the outside voxel centres to the body surface, taken as half a voxel short of the nearest inside centre
+        outside = np.sqrt(squaredDistanceTransform(inside, radius)[~inside]) - 0.5
+        distances, counts = np.unique(pitch * outside[outside <= radius - 0.5], return_counts=True)
+
+        # Many voxels share each lattice distance, so the curve is interpolated between distinct distances to keep it continuous
+        self.distances = np.concatenate([[0.0], distances])
+        self.cumulativeVolume = self.voxelVolume * np.concatenate([[0], np.cumsum(counts)])
+
+    def __repr__(self):
+        return f"DistanceField(shape={self.inside.shape}, pitch={self.pitch}, volume={self.volume}, maxThickness={self.maxThickness})"
+
+    # Function to get the signed distance of every voxel to the surface (negative inside).
+    def signedDistances(self):
+        outside = np.sqrt(squaredDistanceTransform(self.inside, self.radius)) - 0.5
+        inside = np.sqrt(squaredDistanceTransform(~self.inside, self.radius)) - 0.5
+        return self.pitch * np.where(self.inside, -inside, outside)
+
+    # Function to get the narrowest gap between walls of the body (a slot or hole an outside offset closes at half its width).
+    # Along each grid axis, every run of outside voxels closed by the body at both ends is a candidate, and it counts as a gap if
+    # the voxel at its middle is nearest to the run's own ends rather than to some other wall (which rules out runs along a
+    # floor or across the rim of a hole). Gaps wider than twice maxThickness are not seen and give inf.
+    def gapWidth(self):
+        distance = np.sqrt(squaredDistanceTransform(self.inside, self.radius))
+        narrowest = np.inf
+        with np.errstate(invalid='ignore'):
+            for axis in range(self.inside.ndim):
+                before, after, index = _lineNeighbours(self.inside, axis)
+                width = after - before - 1
+                middle = ~self.inside & (np.floor(0.5 * (before + after)) == index) & (width < 2 * (self.radius - 1)) & (distance >= 0.5 * width - 0.5)
+                if middle.any():
+                    narrowest = min(narrowest, float(width[middle].min()))
+        return narrowest * self.pitch
+
+    # Function to get the outside shell volume for one thickness or an array of thicknesses (NaN beyond maxThickness).
+    def shellVolume(self, thickness):
+        thickness = np.asarray(thickness, dtype=float)
+        volume = np.interp(thickness, self.distances, self.cumulativeVolume, left=0.0)
+        return np.where(thickness <= self.maxThickness, volume, np.nan)
+
+    # Function to get the component mass against thickness curve for an array of thicknesses.
+    def massCurve(self, density, thicknesses, otherMass=0.0):
+        return otherMass + density * self.shellVolume(thicknesses)
+
+    # Function to get the thickness whose outside shell has the given volume, or None if it is beyond maxThickness.
+    def thicknessFor(self, shellVolume):
+        if shellVolume > self.cumulativeVolume[-1]:
+            return None
+        return float(np.interp(shellVolume, self.cumulativeVolume, self.distances))
+
+    # Function to get the thickness that carries the target mass at the given density and a bracket of a voxel either side.
+    def seed(self, density, targetMass):
+        if not density or density <= 0:
+            return None
+        thickness = self.thicknessFor(targetMass / density)
+        if thickness is None:
+            return None
+        return thickness, (max(thickness - self.pitch, 0.5 * thickness), thickness + self.pitch)
+
+
+# Function to build the distance field of a closed mesh, with the pitch set by the resolution along the longest side unless given.
+def distanceField(vertices, faces, maxThickness, pitch=None, resolution=128):
+    vertices = np.asarray(vertices, dtype=float)
+    if pitch is None:
+        pitch = float((vertices.max(axis=0) - vertices.min(axis=0)).max()) / resolution
+    radius = int(math.ceil(maxThickness / pitch)) + 2
+    inside, origin = voxelise(vertices, faces, pitch, padding=radius * pitch)
+    return DistanceField(inside, origin, pitch, radius)
+
+
+# Function to get the thickness, bracket and distance field for a mesh whose shell has to hold the target mass, growing the
+# field until the curve reaches the target. The target defaults to the mesh's own mass, which is what the optimiser retains.
+def shellSeed(vertices, faces, density, targetMass=None, pitch=None, resolution=128, maxGrowth=4):
+    properties = ShellMesh.meshProperties(vertices, faces)
+    if targetMass is None:
+        targetMass = density * properties.volume
+
+    # A flat sheet is the thickest a convex shell gets; concave bodies lose volume to self-intersection so start above it
+    maxThickness = 1.5 * targetMass / (density * properties.area)
+    for _ in range(maxGrowth):
+        field = distanceField(vertices, faces, maxThickness, pitch=pitch, resolution=resolution)
+        seed = field.seed(density, targetMass)
+        if seed:
+            return seed[0], seed[1], field
+        maxThickness *= 2
+
+    return None
+
+
+# Function to screen mesh files offline, yielding (path, volume, Steiner thickness, voxel thickness) for each.
+def screenMeshes(paths, density, resolution=128):
+    for path in paths:
+        vertices, faces = ShellMesh.loadMesh(path)
+        properties = ShellMesh.meshProperties(vertices, faces)
+        steiner = properties.shellThickness(density, density * properties.volume)
+        seed = shellSeed(vertices, faces, density, resolution=resolution)
+        yield path, properties.volume, steiner, seed[0] if seed else None
+
+
+if __name__ == '__main__':
+    # python -m shell_lightweighting.ShellSDF part.stl [part.obj ...]
+    print(f"{'Mesh':<40}  {'Volume':>12}  {'Steiner t':>10}  {'Voxel t':>10}")
+    for path, volume, steiner, voxel in screenMeshes(sys.argv[1:], 1.0):
+        print(f"{os.path.basename(path):<40}  {volume:>12.4g}  {steiner or float('nan'):>10.4g}  {voxel or float('nan'):>10.4g}")
@@ -0,0 +1,434 @@
+#Description: One dimensional solvers for the shell thickness optimiser.
+
+"""Root finders on the signed residual mass(t) - target, written to spend as few shell rebuilds as possible."""
+
+import math
+
+# Solver modes.
+BRENT = 'Brent'
+ILLINOIS = 'Illinois'
+SECANT = 'Secant'
+NELDER_MEAD = 'Nelder-Mead'
+LEGACY_NELDER_MEAD = 'Nelder-Mead (legacy)'
+SOLVER_MODES = [BRENT, ILLINOIS, SECANT, NELDER_MEAD, LEGACY_NELDER_MEAD]
+
+_EPS = 2.220446049250313e-16
+_MIN_THICKNESS = 1e-3 # Smallest thickness (mm) a solver will ask for
+
+
+# Raised when the evaluation budget has been spent.
+class SolverBudgetExceeded(Exception):
+    pass
+
+
+# Raised when the residual cannot be evaluated near a requested thickness.
+class SolverEvaluationFailed(Exception):
+    pass
+
+
+# Class to hold the outcome of a solve.
+class SolverResult:
+    def __init__(self, mode, thickness, residual, evaluations, converged, history, message=''):
+        self.mode = mode
+        self.thickness = thickness
+        self.residual = residual
+        self.evaluations = evaluations
+        self.converged = converged
+        self.history = history # [(thickness, residual, step), ...] in evaluation order
+        self.message = message
+
+    def __repr__(self):
+        return f"SolverResult(mode={self.mode!r}, thickness={self.thickness}, residual={self.residual}, evaluations={self.evaluations}, converged={self.converged})"
+
+
+# Class to wrap the residual function with evaluation counting, history and the best point so far. The budget counts calls, so
+# a batch of thicknesses from residualMany costs the same as one evaluation.
+class Objective:
+    def __init__(self, residual, ftol, maxEvaluations, callback=None, residualMany=None):
+        self.residual = residual
+        self.residualMany = residualMany
+        self.ftol = ftol
+        self.maxEvaluations = maxEvaluations
+        self.callback = callback
+        self.calls = 0
+        self.evaluations = 0
+        self.history = []
+        self.best = None # (thickness, residual)
+
+    def __call__(self, thickness, step):
+        self._spend()
+        return self._record(thickness, self.residual(thickness), step)
+
+    # Function to evaluate many thicknesses in one call (falling back to one call per thickness without residualMany).
+    def many(self, thicknesses, step):
+        if not self.residualMany:
+            return [self(thickness, step) for thickness in thicknesses]
+
+        self._spend()
+        values = self.residualMany(thicknesses)
+        return [self._record(thickness, None if value is None or value != value else float(value), step) for thickness, value in zip(thicknesses, values)]
+
+    def _spend(self):
+        if self.calls >= self.maxEvaluations:
+            raise SolverBudgetExceeded(f"Evaluation budget of {self.maxEvaluations} spent.")
+        self.calls += 1
+
+    def _record(self, thickness, value, step):
+        self.evaluations += 1
+        self.history.append((thickness, value, step))
+        if value is not None and (self.best is None or abs(value) < abs(self.best[1])):
+            self.best = (thickness, value)
+        if self.callback:
+            self.callback(self.evaluations, thickness, value, step)
+
+        return value
+
+    # Function to check whether a residual is within the mass tolerance.
+    def converged(self, value):
+        return value is not None and abs(value) < self.ftol
+
+
+# Function to evaluate at a thickness, retrying towards a fallback thickness if the evaluation fails.
+def _evaluateOrRetreat(objective, thickness, fallback, step, retries=2):
+    value = objective(thickness, step)
+    while value is None and retries > 0:
+        thickness = 0.5 * (thickness + fallback)
+        value = objective(thickness, 'retreat')
+        retries -= 1
+    if value is None:
+        raise SolverEvaluationFailed(f"Residual could not be evaluated near {thickness} mm.")
+    return thickness, value
+
+
+# Function to find thicknesses a < b whose residuals change sign, starting from a first guess.
+def findBracket(objective, a, b, fa=None, fb=None, growth=2.0, overshoot=0.05):
+    if a > b:
+        a, b, fa, fb = b, a, fb, fa
+    if fa is None:
+        a, fa = _evaluateOrRetreat(objective, a, b, 'bracket')
+    if objective.converged(fa):
+        return a, a, fa, fa
+    if fb is None:
+        b, fb = _evaluateOrRetreat(objective, b, a, 'bracket')
+
+    step = b - a
+    while fa * fb > 0 and not objective.converged(fb):
+        # Extrapolate the secant through the two points and step a little beyond the estimated root
+        slope = (fb - fa) / (b - a) if b != a else 0
+        if fa < 0: # Both too light, the root is thicker than b
+            estimate = b - fb / slope if slope > 0 else b + growth * step
+            target = min(max(estimate + overshoot * (estimate - b), b + 0.1 * step), b + growth * step)
+            step = target - b
+            a, fa = b, fb
+            b, fb = _evaluateOrRetreat(objective, target, a, 'bracket')
+        else: # Both too heavy, the root is thinner than a
+            estimate = a - fa / slope if slope > 0 else a - growth * step
+            target = max(estimate - overshoot * (a - estimate), a - growth * step, 0.5 * a)
+            target = max(min(target, a - 0.1 * step), _MIN_THICKNESS)
+            if target >= a:
+                raise SolverEvaluationFailed(f"Residual is still positive at the minimum thickness of {_MIN_THICKNESS} mm.")
+            step = a - target
+            b, fb = a, fa
+            a, fa = _evaluateOrRetreat(objective, target, b, 'bracket')
+
+    if objective.converged(fa):
+        return a, a, fa, fa
+    if objective.converged(fb):
+        return b, b, fb, fb
+
+    return a, b, fa, fb
+
+
+# Function to find a sign change of the residual by sampling evenly spaced thicknesses in one batch, widening the range towards
+# the root if every sample lands on the same side.
+def sampleBracket(objective, lo, hi, samples=32, growth=4.0, attempts=4):
+    lo = max(lo, _MIN_THICKNESS)
+    for _ in range(attempts):
+        thicknesses = [lo + (hi - lo) * i / (samples - 1) for i in range(samples)]
+        points = [(t, f) for t, f in zip(thicknesses, objective.many(thicknesses, 'sample')) if f is not None]
+        if not points:
+            raise SolverEvaluationFailed(f"Residual could not be evaluated between {lo} and {hi} mm.")
+
+        for t, f in points:
+            if objective.converged(f):
+                return t, t, f, f
+        for (a, fa), (b, fb) in zip(points, points[1:]):
+            if fa * fb < 0:
+                return a, b, fa, fb
+
+        if points[-1][1] < 0: # Every sample too light, the root is thicker than the range
+            lo, hi = points[-1][0], points[-1][0] + growth * (hi - lo)
+        else: # Every sample too heavy, the root is thinner than the range
+            if points[0][0] <= _MIN_THICKNESS:
+                raise SolverEvaluationFailed(f"Residual is still positive at the minimum thickness of {_MIN_THICKNESS} mm.")
+            lo, hi = max(points[0][0] / growth, _MIN_THICKNESS), points[0][0]
+
+    raise SolverEvaluationFailed(f"No sign change of the residual found in {attempts} batches of {samples} samples.")
+
+
+# Function to find the root of the residual within a bracket using Brent's method.
+def brent(objective, a, b, fa, fb, xtol):
+    if objective.converged(fb):
+        return b, fb
+    if objective.converged(fa):
+        return a, fa
+
+    c, fc = a, fa
+    d = e = b - a
+    while True:
+        if fb * fc > 0:
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+
+        tol1 = 2 * _EPS * abs(b) + 0.5 * xtol
+        xm = 0.5 * (c - b)
+        if abs(xm) <= tol1 or objective.converged(fb):
+            return b, fb
+
+        step = 'bisect'
+        if abs(e) >= tol1 and abs(fa) > abs(fb):
+            s = fb / fa
+            if a == c: # Secant step
+                p = 2 * xm * s
+                q = 1 - s
+            else: # Inverse quadratic interpolation
+                q = fa / fc
+                r = fb / fc
+                p = s * (2 * xm * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            p = abs(p)
+            if 2 * p < min(3 * xm * q - abs(tol1 * q), abs(e * q)):
+                e, d = d, p / q
+                step = 'interpolate'
+            else:
+                d = e = xm
+        else:
+            d = e = xm
+
+        a, fa = b, fb
+        b = b + d if abs(d) > tol1 else b + math.copysign(tol1, xm)
+        b, fb = _evaluateOrRetreat(objective, b, a + xm, step)
+
+
+# Function to find the root of the residual within a bracket using the Illinois variant of regula falsi.
+def illinois(objective, a, b, fa, fb, xtol):
+    if objective.converged(fb):
+        return b, fb
+    if objective.converged(fa):
+        return a, fa
+
+    side = 0
+    while True:
+        c = (a * fb - b * fa) / (fb - fa)
+        c, fc = _evaluateOrRetreat(objective, c, 0.5 * (a + b), 'illinois')
+        if objective.converged(fc):
+            return c, fc
+
+        if fc * fb > 0:
+            b, fb = c, fc
+            if side == -1:
+                fa *= 0.5
+            side = -1
+        else:
+            a, fa = c, fc
+            if side == 1:
+                fb *= 0.5
+            side = 1
+
+        if abs(b - a) < xtol:
+            return (a, fa) if abs(fa) < abs(fb) else (b, fb)
+
+
+# Function to find the root of the residual with the secant method (no bracket is maintained).
+def secant(objective, x0, x1, f0, f1, xtol):
+    if f0 is None:
+        x0, f0 = _evaluateOrRetreat(objective, x0, x1, 'secant')
+    if f1 is None:
+        x1, f1 = _evaluateOrRetreat(objective, x1, x0, 'secant')
+
+    while not objective.converged(f1):
+        if f1 == f0:
+            break
+        x2 = max(x1 - f1 * (x1 - x0) / (f1 - f0), _MIN_THICKNESS)
+        x2, f2 = _evaluateOrRetreat(objective, x2, x1, 'secant')
+        x0, f0, x1, f1 = x1, f1, x2, f2
+        if abs(x1 - x0) < xtol:
+            break
+
+    return x1, f1
+
+
+# Function to minimise the squared residual with a one dimensional Nelder-Mead simplex (two vertices), evaluating exactly the
+# reflected, expanded, contracted or shrunk point of each step. Stops once the best vertex is within the mass tolerance or the
+# simplex is smaller than xtol. Failed evaluations count as infinitely bad.
+def nelderMead(objective, x0, x1, f0, f1, xtol, alpha=1.0, gamma=2.0, rho=0.5, sigma=0.5):
+    def evaluate(thickness, step):
+        thickness = max(thickness, _MIN_THICKNESS)
+        value = objective(thickness, step)
+        return thickness, value, math.inf if value is None else value * value
+
+    if f0 is None:
+        x0, f0, g0 = evaluate(x0, 'initial')
+    else:
+        g0 = f0 * f0
+    if f1 is None:
+        x1, f1, g1 = evaluate(x1, 'initial')
+    else:
+        g1 = f1 * f1
+
+    while True:
+        # Keep the best vertex first
+        if g1 < g0:
+            x0, f0, g0, x1, f1, g1 = x1, f1, g1, x0, f0, g0
+        if objective.converged(f0) or abs(x1 - x0) < xtol:
+            return x0, f0
+
+        # With two vertices the centroid of all but the worst is the best vertex
+        xr, fr, gr = evaluate(x0 + alpha * (x0 - x1), 'reflect')
+        if gr < g0:
+            xe, fe, ge = evaluate(x0 + gamma * (xr - x0), 'expand')
+            x1, f1, g1 = (xe, fe, ge) if ge < gr else (xr, fr, gr)
+            continue
+
+        if gr < g1: # Outside contraction
+            xc, fc, gc = evaluate(x0 + rho * (xr - x0), 'contract')
+            accepted = gc <= gr
+        else: # Inside contraction
+            xc, fc, gc = evaluate(x0 + rho * (x1 - x0), 'contract')
+            accepted = gc < g1
+        if accepted:
+            x1, f1, g1 = xc, fc, gc
+        else:
+            x1, f1, g1 = evaluate(x0 + sigma * (x1 - x0), 'shrink')
+
+
+# Function to minimise the squared mass error with the original three vertex Nelder-Mead loop (legacy solver mode). evaluate(thickness,
+# iteration, step) returns (objective value, mass), with the mass None for a failed shell; the mass behind each simplex value is
+# kept alongside it, so the convergence check on the best vertex reuses it instead of rebuilding that shell. callback(iteration,
+# thickness, mass, simplex) is called after every iteration. Returns (thickness, mass, iterations).
+def legacyNelderMead(evaluate, solidMass, initialThickness, tolerance, maxIterations, callback=None):
+    alpha, gamma, rho, sigma = 1.0, 2.0, 0.5, 0.5 # Reflection, expansion, contraction, shrinkage
+    simplex = [initialThickness, initialThickness*1.1, initialThickness*1.2]
+    iteration = 0
+
+    # Get the initial simplex values
+    try:
+        simplex_values, simplex_masses = [], []
+        for thickness in simplex:
+            value, shellMass = evaluate(thickness, iteration, 'initial')
+            simplex_values.append(value)
+            simplex_masses.append(shellMass)
+    except Exception as inner_e:
+        raise SolverEvaluationFailed(f"Failed to evaluate objective function for thickness {thickness} mm:\n{inner_e}")
+
+    while iteration <= maxIterations:
+        # Sort the simplex values
+        sorted_indices = sorted(range(len(simplex_values)), key=lambda i: simplex_values[i])
+        simplex = [simplex[i] for i in sorted_indices]
+        simplex_values = [simplex_values[i] for i in sorted_indices]
+        simplex_masses = [simplex_masses[i] for i in sorted_indices]
+
+        centroid = sum(simplex[:-1]) / len(simplex[:-1])
+
+        # Reflection
+        reflected_thickness = centroid + alpha * (centroid - simplex[-1])
+        reflected_value, reflected_mass = evaluate(reflected_thickness, iteration, 'reflect')
+
+        if simplex_values[0] <= reflected_value < simplex_values[-2]:
+            simplex[-1], simplex_values[-1], simplex_masses[-1] = reflected_thickness, reflected_value, reflected_mass
+        # Expansion
+        elif reflected_value < simplex_values[0]:
+            expanded_thickness = centroid + gamma * (reflected_thickness - centroid)
+            expanded_value, expanded_mass = evaluate(expanded_thickness, iteration, 'expand')
+            if expanded_value < reflected_value:
+                simplex[-1], simplex_values[-1], simplex_masses[-1] = expanded_thickness, expanded_value, expanded_mass
+            else:
+                simplex[-1], simplex_values[-1], simplex_masses[-1] = reflected_thickness, reflected_value, reflected_mass
+        # Outside contraction if the reflected point beats the worst vertex, inside contraction otherwise
+        else:
+            contracted_thickness = centroid + (rho if reflected_value < simplex_values[-1] else -rho) * (simplex[-1] - centroid)
+            contracted_value, contracted_mass = evaluate(contracted_thickness, iteration, 'contract')
+            if contracted_value < simplex_values[-1]:
+                simplex[-1], simplex_values[-1], simplex_masses[-1] = contracted_thickness, contracted_value, contracted_mass
+            # Shrink
+            else:
+                for i in range(1, len(simplex)):
+                    simplex[i] = simplex[0] + sigma * (simplex[i] - simplex[0])
+                    simplex_values[i], simplex_masses[i] = evaluate(simplex[i], iteration, 'shrink')
+
+        # Check convergence on the best vertex with the mass already weighed for it
+        best = min(range(len(simplex_values)), key=lambda i: simplex_values[i])
+        thickness, shellMass = simplex[best], simplex_masses[best]
+        iteration += 1
+        if callback:
+            callback(iteration, thickness, shellMass, simplex)
+
+        if shellMass and abs(shellMass - solidMass) < tolerance:
+            break
+
+    if not shellMass:
+        raise SolverEvaluationFailed(f"Nelder-Mead could not evaluate a shell at the best thickness of {thickness} mm.")
+
+    return thickness, shellMass, iteration
+
+
+# Function to solve residual(thickness) = 0 with the chosen root finder, starting from a first guess and an optional bracket
+# (lo, hi) around it (e.g. from an analytic estimate). Given residualMany (a batch residual that is cheap per call), the
+# bracket is found by sampling the range in batches and the root finder only refines the sign change.
+def solve(mode, residual, initialThickness, ftol, xtol, maxEvaluations, callback=None, bracket=None, residualMany=None, samples=32):
+    objective = Objective(residual, ftol, maxEvaluations, callback=callback, residualMany=residualMany)
+
+    sampled = residualMany is not None and samples > 1
+    if bracket and not sampled:
+        # Evaluate the first guess, then the bracket end on the side the residual points to
+        try:
+            a, fa = _evaluateOrRetreat(objective, initialThickness, 0.5 * (bracket[0] + bracket[1]), 'seed')
+        except (SolverBudgetExceeded, SolverEvaluationFailed) as e:
+            return SolverResult(mode, None, None, objective.evaluations, False, objective.history, str(e))
+        if objective.converged(fa):
+            return SolverResult(mode, a, fa, objective.evaluations, True, objective.history)
+        b, fb = (bracket[0] if fa > 0 else bracket[1]), None
+        if b == a:
+            b = a * (0.95 if fa > 0 else 1.05)
+    else:
+        a, b, fa, fb = initialThickness, 1.1 * initialThickness, None, None
+
+    message = ''
+    try:
+        if sampled:
+            lo, hi = bracket if bracket else (0.5 * initialThickness, 2 * initialThickness)
+            a, b, fa, fb = sampleBracket(objective, lo, hi, samples)
+
+        if sampled and a == b:
+            thickness, value = a, fa
+        elif mode == SECANT:
+            thickness, value = secant(objective, a, b, fa, fb, xtol)
+        elif mode == NELDER_MEAD:
+            thickness, value = nelderMead(objective, a, b, fa, fb, xtol)
+        elif mode in (BRENT, ILLINOIS):
+            if not sampled:
+                a, b, fa, fb = findBracket(objective, a, b, fa, fb)
+            if a == b:
+                thickness, value = a, fa
+            elif mode == BRENT:
+                thickness, value = brent(objective, a, b, fa, fb, xtol)
+            else:
+                thickness, value = illinois(objective, a, b, fa, fb, xtol)
+        else:
+            raise ValueError(f"Unknown solver mode: {mode}")
+    except (SolverBudgetExceeded, SolverEvaluationFailed) as e:
+        message = str(e)
+        if objective.best is None:
+            return SolverResult(mode, None, None, objective.evaluations, False, objective.history, message)
+        thickness, value = objective.best
+
+    # Report the best evaluated point (a bracket end may be closer to the target than the last step)
+    if objective.best and abs(objective.best[1]) < abs(value):
+        thickness, value = objective.best
+
+    return SolverResult(mode, thickness, value, objective.evaluations, objective.converged(value), objective.history, message)
@@ -0,0 +1,126 @@
+#Description: Stage timing for the shell evaluation pipeline.
+
+"""Span timers around each stage of a shell evaluation, with an optional Chrome Trace Event export."""
+
+import contextlib, json, math, timeit
+
+
+# Function to get the nearest-rank percentile of a list of durations.
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+# Class to buffer Chrome Trace Event Format complete events in memory and write them out in a single flush.
+class TraceWriter:
+    def __init__(self, processName='Shell Optimisation', threadName='Fusion 360'):
+        self.origin = timeit.default_timer()
+        self.events = [
+            {'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': processName}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': threadName}},
+        ]
+
+    # Function to add a span from start to end (timeit.default_timer() values) as a complete event.
+    def complete(self, name, category, start, end, args=None):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': 1e6 * (start - self.origin), 'dur': 1e6 * (end - start), 'pid': 1, 'tid': 1}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    # Function to add a zero-duration marker.
+    def instant(self, name, category, args=None):
+        event = {'name': name, 'cat': category, 'ph': 'i', 's': 't', 'ts': 1e6 * (timeit.default_timer() - self.origin), 'pid': 1, 'tid': 1}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    # Context manager to record the enclosed block as a complete event.
+    @contextlib.contextmanager
+    def span(self, name, category, args=None):
+        t0 = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.complete(name, category, t0, timeit.default_timer(), args)
+
+    # Function to write every buffered event to a JSON trace file that chrome://tracing or ui.perfetto.dev can open.
+    def write(self, path):
+        with open(path, 'w') as traceFile:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, traceFile)
+
+
+# Class to time named stages, both per iteration and over a whole run.
+class StageTimer:
+    def __init__(self):
+        self.trace = None # TraceWriter that stage spans are mirrored to, if tracing is enabled
+        self.reset()
+
+    # Function to clear all recorded durations at the start of a run.
+    def reset(self):
+        self.durations = {} # Stage name -> every recorded duration in seconds (in first-seen order)
+        self.iteration = {} # Stage name -> total seconds since the last iteration boundary
+        self.evaluation = {} # Stage name -> total seconds since the last evaluation boundary (several per legacy iteration)
+
+    # Function to record a duration against a stage.
+    def record(self, stage, seconds):
+        self.durations.setdefault(stage, []).append(seconds)
+        self.iteration[stage] = self.iteration.get(stage, 0.0) + seconds
+        self.evaluation[stage] = self.evaluation.get(stage, 0.0) + seconds
+
+    # Context manager to time the enclosed block as a stage.
+    @contextlib.contextmanager
+    def span(self, stage):
+        t0 = timeit.default_timer()
+        try:
+            yield
+        finally:
+            t1 = timeit.default_timer()
+            self.record(stage, t1 - t0)
+            if self.trace:
+                self.trace.complete(stage, 'stage', t0, t1)
+
+    # Context manager to add a non-stage span (iteration, solver step) to the trace without timing it as a stage.
+    def traceSpan(self, name, category, args=None):
+        if self.trace:
+            return self.trace.span(name, category, args)
+        return contextlib.nullcontext()
+
+    # Function to add an already finished non-stage span to the trace.
+    def traceComplete(self, name, category, start, end, args=None):
+        if self.trace:
+            self.trace.complete(name, category, start, end, args)
+
+    # Function to close the current iteration, returning its stage durations and starting a new one.
+    def endIteration(self):
+        iteration, self.iteration = self.iteration, {}
+        return iteration
+
+    # Function to close the current evaluation, returning its stage durations and starting a new one.
+    def endEvaluation(self):
+        evaluation, self.evaluation = self.evaluation, {}
+        return evaluation
+
+    # Function to format one iteration's stage durations for a log line.
+    @staticmethod
+    def formatIteration(iteration):
+        return ', '.join(f"{stage} {round(seconds, 3)} s" for stage, seconds in iteration.items())
+
+    # Function to get (stage, count, total, mean, p95) for every stage recorded in the run.
+    def summary(self):
+        rows = []
+        for stage, values in self.durations.items():
+            total = sum(values)
+            rows.append((stage, len(values), total, total / len(values), percentile(values, 0.95)))
+        return rows
+
+    # Function to format the run summary as a fixed-width table.
+    def summaryTable(self):
+        rows = self.summary()
+        width = max([len('Stage')] + [len(row[0]) for row in rows])
+        lines = [f"{'Stage':<{width}}  {'Count':>6}  {'Total (s)':>10}  {'Mean (s)':>10}  {'p95 (s)':>10}"]
+        for stage, count, total, mean, p95 in rows:
+            lines.append(f"{stage:<{width}}  {count:>6}  {total:>10.3f}  {mean:>10.3f}  {p95:>10.3f}")
+        return '\n'.join(lines)
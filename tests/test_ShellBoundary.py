@@ -0,0 +1,95 @@
+#Description: Unit tests and a unit benchmark for the closed-loop check of surface boundaries.
+
+import timeit, unittest
+
+from shell_lightweighting import ShellBoundary
+
+
+# Function to get the edges of a closed square loop of side 1 at height z, as (start, end) pairs.
+def square(z=0.0):
+    points = [(0.0, 0.0, z), (1.0, 0.0, z), (1.0, 1.0, z), (0.0, 1.0, z)]
+    return [(points[i], points[(i + 1) % 4]) for i in range(4)]
+
+
+class BoundaryLoopsTests(unittest.TestCase):
+    def test_closed_loop(self):
+        check = ShellBoundary.boundaryLoops(square())
+        self.assertTrue(check.closed)
+        self.assertEqual((check.loops, check.openEdges, check.edges), (1, [], 4))
+
+    def test_reversed_edges_still_close(self):
+        segments = square()
+        segments[1] = segments[1][::-1]
+        segments[3] = segments[3][::-1]
+        self.assertTrue(ShellBoundary.boundaryLoops(segments).closed)
+
+    def test_counts_separate_loops(self):
+        check = ShellBoundary.boundaryLoops(square(0.0) + square(1.0))
+        self.assertTrue(check.closed)
+        self.assertEqual(check.loops, 2)
+
+    def test_reports_the_edges_next_to_a_gap(self):
+        segments = square()
+        del segments[1]
+        check = ShellBoundary.boundaryLoops(segments)
+        self.assertFalse(check.closed)
+        self.assertEqual(check.loops, 1)
+        self.assertEqual(check.openEdges, [0, 1]) # The edges that ended and started at the removed edge
+
+    def test_only_the_open_loop_is_reported(self):
+        segments = square(0.0) + square(1.0)[:3]
+        check = ShellBoundary.boundaryLoops(segments)
+        self.assertFalse(check.closed)
+        self.assertEqual(check.loops, 2)
+        self.assertEqual(check.openEdges, [4, 6])
+
+    def test_endpoints_within_tolerance_are_joined(self):
+        segments = square()
+        start, end = segments[2]
+        segments[2] = (start, (end[0] + 1e-8, end[1] - 1e-8, end[2]))
+        self.assertTrue(ShellBoundary.boundaryLoops(segments, tolerance=1e-6).closed)
+        self.assertFalse(ShellBoundary.boundaryLoops(segments, tolerance=1e-10).closed)
+
+    def test_no_edges_is_not_closed(self):
+        check = ShellBoundary.boundaryLoops([])
+        self.assertFalse(check.closed)
+        self.assertEqual(check.edges, 0)
+
+    def test_agrees_with_the_original_check_on_closed_loops(self):
+        segments = ShellBoundary.syntheticLoops(2000, loopSize=200)
+        self.assertTrue(ShellBoundary.legacyBoundaryClosed(segments))
+        self.assertTrue(ShellBoundary.boundaryLoops(segments).closed)
+
+    def test_catches_gaps_the_original_check_misses(self):
+        # The original only asks each edge to continue at one end, so a single missing edge passes it
+        segments = ShellBoundary.syntheticLoops(2000, loopSize=200, openings=1)
+        self.assertTrue(ShellBoundary.legacyBoundaryClosed(segments))
+        check = ShellBoundary.boundaryLoops(segments)
+        self.assertFalse(check.closed)
+        self.assertEqual(len(check.openEdges), 2)
+
+    def test_synthetic_loops_with_reversed_edges(self):
+        segments = ShellBoundary.syntheticLoops(3000, loopSize=500, reversedShare=0.5, seed=1)
+        check = ShellBoundary.boundaryLoops(segments)
+        self.assertTrue(check.closed)
+        self.assertEqual(check.loops, 6)
+
+
+class BoundaryLoopsBenchmark(unittest.TestCase):
+    # Generous margins so the timings only fail on a return to the quadratic scan, not on a slow machine
+    def test_linear_in_the_number_of_edges(self):
+        small = ShellBoundary.syntheticLoops(10000, seed=2)
+        large = ShellBoundary.syntheticLoops(100000, seed=2)
+        smallSeconds = min(timeit.repeat(lambda: ShellBoundary.boundaryLoops(small), number=1, repeat=3))
+        largeSeconds = min(timeit.repeat(lambda: ShellBoundary.boundaryLoops(large), number=1, repeat=3))
+        self.assertLess(largeSeconds, 30 * smallSeconds) # Quadratic would be about 100 times
+
+    def test_faster_than_the_original_check(self):
+        rows = ShellBoundary.benchmark(sizes=(4000,), loopSize=1000, legacyLimit=4000)
+        edges, loops, openEdges, closed, hashed, legacy = rows[0]
+        self.assertEqual((edges, loops, openEdges, closed), (4000, 4, 0, True))
+        self.assertLess(hashed, legacy)
+
+
+if __name__ == '__main__':
+    unittest.main()
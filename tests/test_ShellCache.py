@@ -0,0 +1,77 @@
+#Description: Unit tests for the stitch memory of the surface fallback.
+
+import unittest
+
+from shell_lightweighting import ShellCache
+
+TOLERANCES = ['0.1 mm', '1 mm', '10 mm']
+LADDER = [(tolerance, False) for tolerance in TOLERANCES] + [(tolerance, True) for tolerance in TOLERANCES]
+
+
+class StitchMemoryTests(unittest.TestCase):
+    def setUp(self):
+        self.memory = ShellCache.StitchMemory(bandRatio=1.25, maxFailures=2)
+        self.key = self.memory.key('body', 2.0)
+
+    def test_key_bands(self):
+        self.assertEqual(self.memory.key('body', 2.0), self.memory.key('body', 2.1))
+        self.assertNotEqual(self.memory.key('body', 2.0), self.memory.key('body', 2.6))
+        self.assertNotEqual(self.memory.key('body', 2.0), self.memory.key('other', 2.0))
+        self.assertEqual(self.memory.key('body', 0), ('body', None))
+        self.assertEqual(self.memory.key('body', None), ('body', None))
+
+    def test_full_ladder_without_memory(self):
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), LADDER)
+
+    def test_last_success_first(self):
+        self.memory.recordSuccess(self.key, '1 mm', False)
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), [('1 mm', False), ('0.1 mm', False), ('10 mm', False)] + LADDER[3:])
+
+    def test_patched_success_skips_the_unpatched_ladder(self):
+        self.memory.recordSuccess(self.key, '10 mm', True)
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), [('10 mm', True), ('0.1 mm', True), ('1 mm', True)])
+
+    def test_neighbouring_band_success(self):
+        self.memory.recordSuccess(self.memory.key('body', 2.0 * 1.25), '1 mm', True)
+        self.assertEqual(self.memory.lastSuccess(self.key), ('1 mm', True))
+        self.assertIsNone(self.memory.lastSuccess(self.memory.key('body', 2.0 * 1.25**3)))
+        self.assertIsNone(self.memory.lastSuccess(self.memory.key('other', 2.0)))
+
+    def test_own_band_wins_over_neighbours(self):
+        self.memory.recordSuccess(self.memory.key('body', 2.0 / 1.25), '10 mm', False)
+        self.memory.recordSuccess(self.key, '0.1 mm', True)
+        self.assertEqual(self.memory.lastSuccess(self.key), ('0.1 mm', True))
+
+    def test_skips_steps_after_max_failures(self):
+        self.memory.recordFailure(self.key, '0.1 mm', False)
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), LADDER)
+        self.memory.recordFailure(self.key, '0.1 mm', False)
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), LADDER[1:])
+
+    def test_failures_are_per_band(self):
+        for _ in range(2):
+            self.memory.recordFailure(self.key, '0.1 mm', False)
+        self.assertEqual(self.memory.order(self.memory.key('body', 5.0), TOLERANCES), LADDER)
+
+    def test_full_ladder_again_when_every_step_is_hopeless(self):
+        for step in LADDER:
+            for _ in range(2):
+                self.memory.recordFailure(self.key, *step)
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), LADDER)
+
+    def test_success_clears_its_failures_and_is_never_skipped(self):
+        for _ in range(2):
+            self.memory.recordFailure(self.key, '1 mm', False)
+        self.memory.recordSuccess(self.key, '1 mm', False)
+        self.assertEqual(self.memory.order(self.key, TOLERANCES)[0], ('1 mm', False))
+        self.assertNotIn(('1 mm', False), self.memory.failures[self.key])
+
+    def test_reset(self):
+        self.memory.recordSuccess(self.key, '1 mm', True)
+        self.memory.recordFailure(self.key, '0.1 mm', True)
+        self.memory.reset()
+        self.assertEqual(self.memory.order(self.key, TOLERANCES), LADDER)
+
+
+if __name__ == '__main__':
+    unittest.main()
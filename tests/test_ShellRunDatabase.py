@@ -0,0 +1,76 @@
+#Description: Unit tests for warm-starting runs from the run database.
+
+import unittest
+
+from shell_lightweighting import ShellRunDatabase
+
+STEEL, ALUMINIUM = 7.85e-3, 2.7e-3
+
+
+class WarmStartTests(unittest.TestCase):
+    def setUp(self):
+        self.database = ShellRunDatabase.RunDatabase(':memory:')
+        self.fingerprint = ShellRunDatabase.Fingerprint(240.0, 248.0, (10.0, 6.0, 4.0))
+
+    def tearDown(self):
+        self.database.close()
+
+    # Function to store a run whose mass rises linearly by 0.1 per mm through the target mass of 2.0 at the given thickness.
+    def record(self, fingerprint, thickness, density=STEEL, token='body', pairs=None):
+        if pairs is None:
+            pairs = [(t, 2.0 + 0.1 * (t - thickness)) for t in (thickness - 1, thickness + 0.5, thickness + 2)]
+        return self.database.recordRun('Design', 'Body', token, fingerprint, density, 2.0, 'Brent', thickness, 2.0, len(pairs), 1.0, pairs)
+
+    def test_no_runs(self):
+        self.assertIsNone(self.database.warmStart(self.fingerprint, STEEL))
+
+    def test_seeds_from_the_stored_curve(self):
+        run = self.record(self.fingerprint, 3.0)
+        thickness, (lo, hi), matched, distance = self.database.warmStart(self.fingerprint, STEEL)
+        self.assertEqual((matched, distance), (run, 0.0))
+        self.assertAlmostEqual(thickness, 3.0)
+        # Identical fingerprints get the minimum margin
+        self.assertAlmostEqual(lo, 0.995 * thickness)
+        self.assertAlmostEqual(hi, 1.005 * thickness)
+
+    def test_interpolates_the_crossing_nearest_the_result(self):
+        # The stored result is off the curve's crossing, which the seed follows
+        self.record(self.fingerprint, 3.0, pairs=[(2.0, 1.9), (4.0, 2.3)])
+        self.assertAlmostEqual(self.database.warmStart(self.fingerprint, STEEL)[0], 2.5)
+
+    def test_falls_back_to_the_stored_result(self):
+        self.record(self.fingerprint, 3.0, pairs=[(2.0, 1.5), (2.5, 1.7)])
+        self.assertAlmostEqual(self.database.warmStart(self.fingerprint, STEEL)[0], 3.0)
+
+    def test_bracket_widens_with_distance(self):
+        self.record(self.fingerprint, 3.0)
+        edited = ShellRunDatabase.Fingerprint(246.0, 248.0, (10.0, 6.0, 4.1))
+        thickness, (lo, hi), _, distance = self.database.warmStart(edited, STEEL)
+        self.assertAlmostEqual(distance, 6.0 / 246.0) # Largest relative difference, of the volumes
+        self.assertAlmostEqual(lo, (1 - 2 * distance) * thickness)
+        self.assertAlmostEqual(hi, (1 + 2 * distance) * thickness)
+
+    def test_ignores_distant_bodies_and_other_densities(self):
+        self.record(ShellRunDatabase.Fingerprint(480.0, 400.0, (20.0, 6.0, 4.0)), 3.0)
+        self.record(self.fingerprint, 3.0, density=ALUMINIUM)
+        self.assertIsNone(self.database.warmStart(self.fingerprint, STEEL))
+        self.assertIsNotNone(self.database.warmStart(self.fingerprint, ALUMINIUM))
+
+    def test_prefers_the_nearest_then_the_same_body_then_the_newest(self):
+        near = self.record(self.fingerprint, 3.0, token='other')
+        self.record(ShellRunDatabase.Fingerprint(243.0, 248.0, (10.0, 6.0, 4.0)), 4.0)
+        self.assertEqual(self.database.warmStart(self.fingerprint, STEEL, token='body')[2], near)
+
+        same = self.record(self.fingerprint, 3.5, token='body')
+        self.assertEqual(self.database.warmStart(self.fingerprint, STEEL, token='body')[2], same)
+
+        newest = self.record(self.fingerprint, 3.2, token='body')
+        self.assertEqual(self.database.warmStart(self.fingerprint, STEEL, token='body')[2], newest)
+
+    def test_failed_evaluations_are_not_stored(self):
+        run = self.record(self.fingerprint, 3.0, pairs=[(2.0, 1.9), (3.0, None), (4.0, 2.1)])
+        self.assertEqual(self.database.runCurve(run)[2], [(2.0, 1.9), (4.0, 2.1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
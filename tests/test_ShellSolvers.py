@@ -0,0 +1,229 @@
+#Description: Unit tests for the shell thickness solvers on the headless backends.
+
+"""Checks the root finders and the Nelder-Mead simplex on FunctionBackend and MeshBackend stand-ins with known roots. Run from
+the repository root with: python -m unittest discover tests (or python -m pytest tests)"""
+
+import unittest
+
+from shell_lightweighting import ShellBackends, ShellEstimate, ShellSolvers
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Function to get an Objective on a function backend whose mass is quadratic in the thickness, with its root at the given thickness.
+def quadraticObjective(root, ftol=1e-9, maxEvaluations=100):
+    backend = ShellBackends.FunctionBackend(lambda thickness: 1.0 + 0.5 * thickness + thickness**2, 1.0 + 0.5 * root + root**2, quantum=1e-12)
+    return ShellSolvers.Objective(backend.residual, ftol, maxEvaluations), backend
+
+
+class RootFinderTests(unittest.TestCase):
+    root = 2.5
+
+    def bracketed(self, solver):
+        objective, _ = quadraticObjective(self.root)
+        a, b = 1.0, 4.0
+        return solver(objective, a, b, objective(a, 'test'), objective(b, 'test'), 1e-9), objective
+
+    def test_brent_converges(self):
+        (thickness, value), objective = self.bracketed(ShellSolvers.brent)
+        self.assertAlmostEqual(thickness, self.root, places=7)
+        self.assertTrue(objective.converged(value))
+
+    def test_illinois_converges(self):
+        (thickness, value), objective = self.bracketed(ShellSolvers.illinois)
+        self.assertAlmostEqual(thickness, self.root, places=7)
+        self.assertTrue(objective.converged(value))
+
+    def test_secant_converges(self):
+        objective, _ = quadraticObjective(self.root)
+        thickness, value = ShellSolvers.secant(objective, 1.0, 1.1, None, None, 1e-12)
+        self.assertAlmostEqual(thickness, self.root, places=7)
+        self.assertTrue(objective.converged(value))
+
+    def test_brent_needs_fewer_evaluations_than_bisection(self):
+        # Bisection would need log2(3 / 1e-9), about 32, evaluations for the same interval
+        (_, _), objective = self.bracketed(ShellSolvers.brent)
+        self.assertLess(objective.evaluations, 20)
+
+
+class FindBracketTests(unittest.TestCase):
+    def test_extends_upwards(self):
+        objective, _ = quadraticObjective(10.0)
+        a, b, fa, fb = ShellSolvers.findBracket(objective, 1.0, 1.1)
+        self.assertLess(fa, 0)
+        self.assertGreater(fb, 0)
+        self.assertLessEqual(a, 10.0)
+        self.assertGreaterEqual(b, 10.0)
+
+    def test_extends_downwards(self):
+        objective, _ = quadraticObjective(0.2)
+        a, b, fa, fb = ShellSolvers.findBracket(objective, 5.0, 5.5)
+        self.assertLess(fa, 0)
+        self.assertGreater(fb, 0)
+        self.assertLessEqual(a, 0.2)
+        self.assertGreaterEqual(b, 0.2)
+        self.assertGreaterEqual(a, ShellSolvers._MIN_THICKNESS)
+
+    def test_keeps_a_bracket_that_already_changes_sign(self):
+        objective, _ = quadraticObjective(2.5)
+        self.assertEqual(ShellSolvers.findBracket(objective, 4.0, 1.0)[:2], (1.0, 4.0))
+        self.assertEqual(objective.evaluations, 2)
+
+    def test_retreats_from_failed_evaluations(self):
+        backend = ShellBackends.FunctionBackend(lambda thickness: None if thickness > 6 else 1.0 + thickness**2, 1.0 + 9.0, quantum=1e-12)
+        objective = ShellSolvers.Objective(backend.residual, 1e-9, 100)
+        a, b, fa, fb = ShellSolvers.findBracket(objective, 1.0, 1.1)
+        self.assertLessEqual(a, 3.0)
+        self.assertGreaterEqual(b, 3.0)
+        self.assertLessEqual(b, 6.0)
+
+    def test_fails_if_the_residual_stays_positive(self):
+        backend = ShellBackends.FunctionBackend(lambda thickness: 1.0 + thickness, 0.5, quantum=1e-12)
+        objective = ShellSolvers.Objective(backend.residual, 1e-9, 100)
+        with self.assertRaises(ShellSolvers.SolverEvaluationFailed):
+            ShellSolvers.findBracket(objective, 1.0, 1.1)
+
+
+class NelderMeadTests(unittest.TestCase):
+    def test_stops_on_ftol(self):
+        objective, _ = quadraticObjective(2.5, ftol=1e-3)
+        thickness, value = ShellSolvers.nelderMead(objective, 1.0, 1.1, None, None, 1e-12)
+        self.assertLess(abs(value), 1e-3)
+        self.assertAlmostEqual(thickness, 2.5, places=2)
+
+    def test_stops_on_xtol(self):
+        # With no achievable mass tolerance the simplex only stops once it is smaller than xtol
+        objective, _ = quadraticObjective(2.5, ftol=0.0)
+        thickness, value = ShellSolvers.nelderMead(objective, 1.0, 1.1, None, None, 1e-4)
+        self.assertAlmostEqual(thickness, 2.5, delta=1e-3)
+        self.assertLess(objective.evaluations, 100)
+
+    def test_looser_xtol_stops_sooner(self):
+        loose, _ = quadraticObjective(2.5, ftol=0.0)
+        tight, _ = quadraticObjective(2.5, ftol=0.0)
+        ShellSolvers.nelderMead(loose, 1.0, 1.1, None, None, 1e-2)
+        ShellSolvers.nelderMead(tight, 1.0, 1.1, None, None, 1e-6)
+        self.assertLess(loose.evaluations, tight.evaluations)
+
+    def test_evaluates_each_step_point(self):
+        objective, _ = quadraticObjective(2.5, ftol=0.0)
+        ShellSolvers.nelderMead(objective, 1.0, 1.1, None, None, 1e-6)
+        steps = [step for _, _, step in objective.history]
+        self.assertEqual(steps[:2], ['initial', 'initial'])
+        self.assertIn('expand', steps)
+        self.assertIn('contract', steps)
+        # Expansion and contraction evaluate their own point, not the reflected point again
+        for (reflected, _, _), (thickness, _, step) in zip(objective.history, objective.history[1:]):
+            if step in ('expand', 'contract'):
+                self.assertNotEqual(thickness, reflected)
+
+
+class LegacyNelderMeadTests(unittest.TestCase):
+    def evaluate(self, backend):
+        solidMass = backend.targetMass()
+
+        def evaluate(thickness, iteration, step):
+            shellMass = backend.evaluate(thickness)
+            return ((shellMass - solidMass)**2, shellMass) if shellMass else (1e6, None)
+        return evaluate
+
+    def test_converges_on_the_mass_tolerance(self):
+        _, backend = quadraticObjective(2.5)
+        iterations = []
+        thickness, shellMass, iteration = ShellSolvers.legacyNelderMead(self.evaluate(backend), backend.targetMass(), 1.0, 1e-4, 200,
+                                                                        callback=lambda *args: iterations.append(args))
+        self.assertLess(abs(shellMass - backend.targetMass()), 1e-4)
+        self.assertAlmostEqual(thickness, 2.5, places=3)
+        self.assertEqual(len(iterations), iteration)
+        self.assertEqual(iterations[-1][1:3], (thickness, shellMass))
+
+    def test_fails_without_a_shell(self):
+        backend = ShellBackends.FunctionBackend(lambda thickness: None, 1.0)
+        with self.assertRaises(ShellSolvers.SolverEvaluationFailed):
+            ShellSolvers.legacyNelderMead(self.evaluate(backend), 1.0, 1.0, 1e-4, 5)
+
+
+class SolveTests(unittest.TestCase):
+    root = 2.5
+
+    def solve(self, mode, **kwargs):
+        objective, backend = quadraticObjective(self.root)
+        return ShellSolvers.solve(mode, backend.residual, 1.0, 1e-9, 1e-9, 100, **kwargs)
+
+    def test_dispatches_to_each_mode(self):
+        for mode in (ShellSolvers.BRENT, ShellSolvers.ILLINOIS, ShellSolvers.SECANT, ShellSolvers.NELDER_MEAD):
+            with self.subTest(mode=mode):
+                result = self.solve(mode)
+                self.assertEqual(result.mode, mode)
+                self.assertTrue(result.converged)
+                self.assertAlmostEqual(result.thickness, self.root, places=6)
+
+    def test_dispatches_by_step_names(self):
+        # The bracket already changes sign, so every step after the seed and the bracket end comes from the chosen solver
+        steps = lambda mode: {step for _, _, step in self.solve(mode, bracket=(0.5, 5.0)).history[2:]}
+        self.assertLessEqual(steps(ShellSolvers.BRENT), {'interpolate', 'bisect'})
+        self.assertEqual(steps(ShellSolvers.ILLINOIS), {'illinois'})
+        self.assertEqual(steps(ShellSolvers.SECANT), {'secant'})
+        self.assertIn('reflect', steps(ShellSolvers.NELDER_MEAD))
+
+    def test_unknown_mode_raises(self):
+        with self.assertRaises(ValueError):
+            self.solve('Bisection')
+
+    def test_budget_returns_the_best_point(self):
+        objective, backend = quadraticObjective(self.root)
+        result = ShellSolvers.solve(ShellSolvers.BRENT, backend.residual, 1.0, 1e-12, 1e-12, 4)
+        self.assertFalse(result.converged)
+        self.assertEqual(result.evaluations, 4)
+        self.assertEqual(result.residual, min((value for _, value, _ in result.history), key=abs))
+        self.assertTrue(result.message)
+
+    def test_seed_inside_bracket(self):
+        result = self.solve(ShellSolvers.BRENT, bracket=(0.5, 5.0))
+        self.assertTrue(result.converged)
+        self.assertEqual(result.history[0][2], 'seed')
+
+
+@unittest.skipIf(np is None, 'The mesh backend needs NumPy.')
+class MeshBackendTests(unittest.TestCase):
+    def setUp(self):
+        self.backend = self.boxBackend()
+        self.root = self.rootThickness()
+
+    # Function to build a mesh backend of a 10x6x4 steel box, with a mass cache fine enough not to limit the solvers.
+    def boxBackend(self):
+        return ShellBackends.MeshBackend(*ShellBackends.boxMesh(10.0, 6.0, 4.0), 7.85e-3, quantum=1e-12)
+
+    # Function to find the thickness whose Steiner shell volume equals the box volume by bisection.
+    def rootThickness(self):
+        lo, hi = 0.0, 10.0
+        for _ in range(200):
+            mid = 0.5 * (lo + hi)
+            if ShellEstimate.offsetShellVolume(self.backend.area, self.backend.meanCurvature, mid) < self.backend.volume:
+                lo = mid
+            else:
+                hi = mid
+        return hi
+
+    def test_box_properties(self):
+        self.assertAlmostEqual(self.backend.volume, 240.0)
+        self.assertAlmostEqual(self.backend.area, 248.0)
+
+    def test_sampled_solve(self):
+        for mode in (ShellSolvers.BRENT, ShellSolvers.ILLINOIS, ShellSolvers.SECANT, ShellSolvers.NELDER_MEAD):
+            with self.subTest(mode=mode):
+                result = ShellBackends.optimise(self.boxBackend(), mode, 1.0, 1e-6, xtol=1e-9)
+                self.assertTrue(result.converged)
+                self.assertAlmostEqual(result.thickness, self.root, places=3)
+                self.assertIn('sample', {step for _, _, step in result.history})
+
+    def test_legacy_mode_is_fusion_only(self):
+        with self.assertRaises(ValueError):
+            ShellBackends.optimise(self.backend, ShellSolvers.LEGACY_NELDER_MEAD, 1.0, 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()